@@ -0,0 +1,95 @@
+"""
+Per-request CPU time of the /api/v1 JSON reads against the HTML pages showing the same data.
+
+    python bench/api_vs_html.py --papers 300 --requests 200
+"""
+import argparse
+import datetime
+import os
+import sys
+import tempfile
+import time
+
+repo = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, repo)
+
+# Databases are created relative to the working directory, templates and static files are looked up from it
+os.chdir(tempfile.mkdtemp(prefix="papersplease-bench-"))
+os.symlink(os.path.join(repo, "papersplease"), "papersplease")
+
+from fastapi.testclient import TestClient
+from sqlmodel import Session
+
+import main
+from papersplease.orm import connect
+from papersplease.orm.model import Account, Conference, Paper, PaperAuthor, Assignment, Recommendation
+from papersplease.security.token import create_access_token
+
+CHAIR = "chair@example.com"
+USER = "user@example.com"
+
+PAIRS = [
+    ("author papers", "/author", "/api/v1/papers", USER),
+    ("reviewer assignments", "/assignments", "/api/v1/assignments", USER),
+    ("chair conference", "/conferences/papers?conf_id={conf}", "/api/v1/conferences/{conf}/reviews", CHAIR),
+]
+
+
+def seed(papers: int) -> int:
+    """A conference where the user authors and reviews every paper"""
+    with Session(connect.engine) as sess:
+        for email in (CHAIR, USER, *(f"r{i}@example.com" for i in range(2))):
+            sess.add(Account(email=email, first_name="A", last_name="B", title="Dr.", affiliation="x", password="-"))
+        day = datetime.date.today() + datetime.timedelta(days=30)
+        conf = Conference(name="C", city="c", state="s", country="c", start_date=day, end_date=day,
+                          paper_deadline=day, chair=CHAIR)
+        sess.add(conf)
+        sess.commit()
+        conf_id = conf.id
+
+    with Session(connect.conference_engine(conf_id, create=True)) as sess:
+        for _ in range(papers):
+            paper = Paper(id=connect.allocate_paper_id(conf_id), conference_id=conf_id, title="P")
+            sess.add(paper)
+            sess.flush()
+            sess.add(PaperAuthor(paper_id=paper.id, author_email=USER))
+            sess.add_all([
+                Assignment(paper_id=paper.id, reviewer_email=email, recommendation=Recommendation.accept)
+                for email in (USER, "r0@example.com", "r1@example.com")
+            ])
+        sess.commit()
+
+    return conf_id
+
+
+def cpu_per_request(client: TestClient, url: str, requests: int) -> float:
+    """Mean CPU time of a request, in milliseconds"""
+    assert client.get(url).status_code == 200, url
+
+    start = time.process_time()
+    for _ in range(requests):
+        client.get(url)
+    return (time.process_time() - start) / requests * 1000
+
+
+def main_():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--papers", type=int, default=300)
+    parser.add_argument("--requests", type=int, default=200)
+    args = parser.parse_args()
+
+    connect.engine.echo = False
+    connect.prepare_db()
+    conf_id = seed(args.papers)
+
+    with TestClient(main.app) as client:
+        print(f"{'':<22} {'html':>10} {'api':>10}")
+        for name, html, api, email in PAIRS:
+            client.cookies.set("access_token", f"bearer {create_access_token(email)}")
+            html_ms = cpu_per_request(client, html.format(conf=conf_id), args.requests)
+            api_ms = cpu_per_request(client, api.format(conf=conf_id), args.requests)
+            print(f"{name:<22} {html_ms:8.2f}ms {api_ms:8.2f}ms")
+
+
+if __name__ == "__main__":
+    main_()
@@ -0,0 +1,131 @@
+"""
+Hot table query latency before and after archiving finished conferences.
+
+Seeds a scratch database with several years of conferences, times the per-request author and reviewer queries,
+archives every finished conference, then times them again. Roles are left out: they are read from the conference
+member index, which archiving keeps whole.
+
+    python bench/archive_hot_tables.py --years 5 --papers 300
+"""
+import argparse
+import datetime
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Databases are created relative to the working directory when the package is imported
+os.chdir(tempfile.mkdtemp(prefix="papersplease-bench-"))
+
+from sqlalchemy import insert
+from sqlmodel import Session, select
+
+from papersplease.orm import connect
+from papersplease.orm.archive import archive_finished
+from papersplease.orm.model import Account, Conference, Paper, PaperAuthor, Assignment, Decision, DecisionStatus
+
+
+def seed(years: int, confs_per_year: int, papers: int, accounts: int):
+    """Seeds conferences ending in each of the past years, plus one still running"""
+    connect.prepare_db()
+    emails = [f"user{i}@example.com" for i in range(accounts)]
+    today = datetime.date.today()
+
+    with Session(connect.engine) as sess:
+        sess.execute(insert(Account), [
+            dict(email=e, first_name="A", last_name="B", title="Dr.", affiliation="x", password="-") for e in emails
+        ])
+        sess.commit()
+
+        for year in range(years, -1, -1):
+            for _ in range(confs_per_year):
+                end = today - datetime.timedelta(days=365 * year - 30)
+                conf = Conference(name="C", city="c", state="s", country="c", start_date=end, end_date=end,
+                                  paper_deadline=end, chair=random.choice(emails))
+                sess.add(conf)
+                sess.commit()
+
+                with Session(connect.conference_engine(conf.id, create=True)) as conf_sess:
+                    for _ in range(papers):
+                        paper = Paper(id=connect.allocate_paper_id(conf.id), conference_id=conf.id, title="P")
+                        conf_sess.add(paper)
+                        conf_sess.flush()
+
+                        people = random.sample(emails, 6)
+                        conf_sess.add_all([PaperAuthor(paper_id=paper.id, author_email=e) for e in people[:3]])
+                        conf_sess.add_all([Assignment(paper_id=paper.id, reviewer_email=e) for e in people[3:]])
+                        conf_sess.add(Decision(paper_id=paper.id, status=DecisionStatus.publish))
+                    conf_sess.commit()
+
+    return emails
+
+
+def time_queries(emails: list[str], rounds: int) -> dict[str, list[float]]:
+    """Times the queries every author or reviewer page load issues"""
+
+    def author_papers(sess: Session, email: str):
+        return sess.exec(
+            select(Paper).join(PaperAuthor, PaperAuthor.paper_id == Paper.id).where(PaperAuthor.author_email == email)
+        ).all()
+
+    def reviewer_assignments(sess: Session, email: str):
+        return sess.exec(
+            select(Paper, Assignment).where(Paper.id == Assignment.paper_id).where(Assignment.reviewer_email == email)
+        ).all()
+
+    hot_engines = connect.conference_engines()
+
+    timings = {"author_papers": [], "reviewer_assignments": []}
+    for _ in range(rounds):
+        email = random.choice(emails)
+
+        # Hot tables only, which is what every write and current conference view hits
+        for name, query in (("author_papers", author_papers), ("reviewer_assignments", reviewer_assignments)):
+            start = time.perf_counter()
+            for eng in hot_engines:
+                with Session(eng) as sess:
+                    query(sess, email)
+            timings[name].append(time.perf_counter() - start)
+
+    return timings
+
+
+def report(label: str, timings: dict[str, list[float]]):
+    print(label)
+    for name, samples in timings.items():
+        samples = sorted(samples)
+        p50 = statistics.median(samples) * 1000
+        p99 = samples[int(len(samples) * 0.99) - 1] * 1000
+        print(f"  {name:<22} p50 {p50:8.3f}ms  p99 {p99:8.3f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--years", type=int, default=5, help="years of finished conferences")
+    parser.add_argument("--confs-per-year", type=int, default=10)
+    parser.add_argument("--papers", type=int, default=300, help="papers per conference")
+    parser.add_argument("--accounts", type=int, default=2000)
+    parser.add_argument("--rounds", type=int, default=300)
+    args = parser.parse_args()
+
+    connect.engine.echo = False
+
+    start = time.perf_counter()
+    emails = seed(args.years, args.confs_per_year, args.papers, args.accounts)
+    print(f"seeded {(args.years + 1) * args.confs_per_year * args.papers} papers in {time.perf_counter() - start:.1f}s")
+
+    report("before archiving", time_queries(emails, args.rounds))
+
+    start = time.perf_counter()
+    archived = archive_finished()
+    print(f"archived {len(archived)} conferences in {time.perf_counter() - start:.1f}s")
+
+    report("after archiving", time_queries(emails, args.rounds))
+
+
+if __name__ == "__main__":
+    main()
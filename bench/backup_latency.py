@@ -0,0 +1,108 @@
+"""
+Query latency while an online backup runs.
+
+Fills a scratch database to the given size, in the journal mode the app runs its databases in unless told otherwise,
+then times point reads and small writes from another thread with no backup running, during a backup copy as the app
+takes it, and during a copy forced into one step. Only the copy touches the live database, so compression is left out.
+
+    python bench/backup_latency.py --size-mb 4096
+"""
+import argparse
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Databases are created relative to the working directory when the package is imported
+os.chdir(tempfile.mkdtemp(prefix="papersplease-bench-"))
+
+from papersplease.orm.backup import copy_database
+from papersplease.orm.connect import JOURNAL_MODE
+
+DB = "load.sqlite"
+ROW_BYTES = 4000
+
+
+def fill(size_mb: int, journal_mode: str) -> int:
+    conn = sqlite3.connect(DB)
+    conn.execute(f"PRAGMA journal_mode={journal_mode}")
+    conn.execute("CREATE TABLE blob (id INTEGER PRIMARY KEY, data BLOB)")
+    rows = size_mb * (1 << 20) // ROW_BYTES
+    for i in range(0, rows, 10000):
+        conn.executemany(
+            "INSERT INTO blob (data) VALUES (?)", ((random.randbytes(ROW_BYTES),) for _ in range(min(10000, rows - i)))
+        )
+        conn.commit()
+    conn.close()
+    return rows
+
+
+def load(rows: int, stop: threading.Event, reads: list[float], writes: list[float], write_interval: float):
+    """Point reads as fast as possible, with a small write every write_interval seconds"""
+    conn = sqlite3.connect(DB, timeout=30)
+    next_write = time.perf_counter() + write_interval
+    while not stop.is_set():
+        start = time.perf_counter()
+        conn.execute("SELECT data FROM blob WHERE id = ?", (random.randint(1, rows),)).fetchone()
+        reads.append(time.perf_counter() - start)
+
+        if write_interval and start >= next_write:
+            start = time.perf_counter()
+            conn.execute("UPDATE blob SET data = ? WHERE id = ?", (b"x", random.randint(1, rows)))
+            conn.commit()
+            writes.append(time.perf_counter() - start)
+            next_write = start + write_interval
+    conn.close()
+
+
+def run(label: str, rows: int, args, backup=None):
+    stop = threading.Event()
+    reads, writes = [], []
+    worker = threading.Thread(target=load, args=(rows, stop, reads, writes, args.write_interval))
+    worker.start()
+
+    start = time.perf_counter()
+    if backup:
+        backup()
+    else:
+        time.sleep(args.idle_seconds)
+    elapsed = time.perf_counter() - start
+
+    stop.set()
+    worker.join()
+    print(f"{label:<14} {elapsed:7.1f}s  reads {summary(reads)}  writes {summary(writes)}")
+
+
+def summary(samples: list[float]) -> str:
+    if len(samples) < 2:
+        return f"n={len(samples)}"
+    cuts = statistics.quantiles(samples, n=100)
+    return f"n={len(samples)} p50 {cuts[49] * 1000:.2f}ms p99 {cuts[98] * 1000:.2f}ms max {max(samples) * 1000:.1f}ms"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--size-mb", type=int, default=512)
+    parser.add_argument("--pages", type=int, default=256, help="pages copied per step")
+    parser.add_argument("--pause", type=float, default=0.005, help="seconds between steps")
+    parser.add_argument("--write-interval", type=float, default=0.25, help="seconds between writes, 0 for none")
+    parser.add_argument("--idle-seconds", type=float, default=5.0)
+    parser.add_argument("--journal-mode", default=JOURNAL_MODE, help="defaults to the mode the app uses")
+    args = parser.parse_args()
+
+    rows = fill(args.size_mb, args.journal_mode)
+    print(f"{os.path.getsize(DB) / (1 << 20):.0f}MB database in {args.journal_mode} mode")
+
+    run("no backup", rows, args)
+    run("backup", rows, args, lambda: copy_database(DB, "backup.sqlite", args.pages, args.pause))
+    run("single step", rows, args, lambda: copy_database(DB, "single.sqlite", -1, 0))
+
+
+if __name__ == "__main__":
+    main()
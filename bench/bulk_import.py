@@ -0,0 +1,54 @@
+"""
+Throughput of the bulk account import.
+
+Imports generated accounts into a scratch database, half with given passwords and half with generated secrets,
+then imports the same file again to time the existing email skip.
+
+    python bench/bulk_import.py --count 10000
+"""
+import argparse
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Databases are created relative to the working directory when the package is imported
+os.chdir(tempfile.mkdtemp(prefix="papersplease-bench-"))
+
+from sqlmodel import SQLModel
+
+from papersplease.orm.connect import engine
+from papersplease.orm.bulk_import import import_accounts, ImportReport
+
+
+def show(label: str, report: ImportReport):
+    print(
+        f"{label}: imported {report.imported}, skipped {report.skipped}, "
+        f"hashing {report.hash_seconds:.2f}s, inserting {report.insert_seconds:.2f}s, "
+        f"{report.per_second:.1f} accounts/s"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--count", type=int, default=10000)
+    parser.add_argument("--workers", type=int, help="hashing processes, defaults to all cores")
+    args = parser.parse_args()
+
+    engine.echo = False
+    SQLModel.metadata.create_all(engine)
+
+    rows = [
+        dict(email=f"user{i}@example.com", first_name="A", last_name="B", title="Dr.", affiliation="x",
+             password=f"password{i}" if i % 2 else "")
+        for i in range(args.count)
+    ]
+
+    print(f"{os.cpu_count()} cores")
+    show("fresh import", import_accounts(rows, args.workers))
+    show("re-import", import_accounts(rows, args.workers))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,4 @@
+import asyncio
 import datetime
 from typing import Annotated
 
@@ -8,15 +9,26 @@ from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel
 from sqlmodel import Session, select
 from starlette import status
-from starlette.responses import RedirectResponse
-
-from papersplease.orm.connect import prepare_db
+from starlette.responses import RedirectResponse, StreamingResponse
+
+from papersplease.orm.connect import (
+    prepare_db,
+    conference_engine,
+    allocate_paper_id,
+    fan_out,
+    read_archive,
+    record_members,
+    SHARDED,
+)
 from papersplease.deps import (
     db_session,
+    paper_db_session,
+    conf_db_session,
+    session_for_paper,
+    missing_paper,
     get_current_user,
     ensure_user_not_logged_in,
     get_user_roles,
-    get_user_owned_paper,
     get_avil_conferences,
     get_owned_conferences,
 )
@@ -30,23 +42,57 @@ from papersplease.orm.model import (
     Decision,
     Recommendation,
     DecisionStatus,
+    MemberRole,
 )
 from papersplease.orm.utils import Roles
+from papersplease.orm.loaders import load_author_paper, load_chair_paper
+from papersplease.orm.querylog import query_budget, QueryBudgetMiddleware, budget_mode
+from papersplease.profiling import ProfilingMiddleware, profile_settings
+from papersplease.orm.backup import backup_loop, backup_interval
+from papersplease.events import broker, conference_channel, event_stream
+from papersplease import api
 from papersplease.security import password
 from papersplease.security.token import Token, create_access_token
 
 app = FastAPI()
 
+# Budgets are declared for the single database layout. Sharded, statement counts grow with the number of shards
+# and include creating shard tables, so budgets are not checked.
+if (mode := budget_mode()) and not SHARDED:
+    app.add_middleware(QueryBudgetMiddleware, strict=mode == "strict")
+
+# Outermost, so its SQL capture sees everything
+app.add_middleware(ProfilingMiddleware, **profile_settings())
+
+app.include_router(api.router)
+
 templates = Jinja2Templates("papersplease/templates")
 app.mount("/static", StaticFiles(directory="papersplease/static"), name="static")
 
 
+backup_task: asyncio.Task | None = None
+
+
 @app.on_event("startup")
-def on_startup():
+async def on_startup():
+    global backup_task
+
     prepare_db()
+    await broker.start()
+
+    if interval := backup_interval():
+        backup_task = asyncio.create_task(backup_loop(interval))
+
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    if backup_task:
+        backup_task.cancel()
+    await broker.stop()
 
 
 @app.get("/")
+@query_budget(2)
 async def root(request: Request, roles: Annotated[Roles, Depends(get_user_roles)]):
     """Home landing page for signed in users"""
 
@@ -56,20 +102,23 @@ async def root(request: Request, roles: Annotated[Roles, Depends(get_user_roles)
 
 
 @app.get("/author")
+@query_budget(4)
 async def author_page(
     request: Request,
     roles: Annotated[Roles, Depends(get_user_roles)],
     account: Annotated[AccountDTO, Depends(get_current_user)],
-    sess: Annotated[Session, Depends(db_session)],
 ):
     """Main author page"""
 
     # Get users papers
-    papers = sess.exec(
-        select(Paper)
-        .join(PaperAuthor, PaperAuthor.paper_id == Paper.id)
-        .where(PaperAuthor.author_email == account.email)
-    ).all()
+    papers = fan_out(
+        lambda sess: sess.exec(
+            select(Paper)
+            .join(PaperAuthor, PaperAuthor.paper_id == Paper.id)
+            .where(PaperAuthor.author_email == account.email)
+        ).all(),
+        history=True,
+    )
 
     return templates.TemplateResponse(
         "author.html.jinja", {"request": request, "roles": roles, "papers": papers}
@@ -77,41 +126,38 @@ async def author_page(
 
 
 @app.get("/author/paper")
+@query_budget(4)
 async def author_paperview(
     request: Request,
     roles: Annotated[Roles, Depends(get_user_roles)],
-    sess: Annotated[Session, Depends(db_session)],
-    selected_paper: Annotated[Paper, Depends(get_user_owned_paper)],
+    account: Annotated[AccountDTO, Depends(get_current_user)],
+    sess: Annotated[Session, Depends(paper_db_session)],
+    paper_id: int,
 ):
     """Author paper view"""
 
-    # Get metadata
-    conf = sess.get(Conference, selected_paper.conference_id)
-    dec = sess.get(Decision, selected_paper.id)
-    authors = ",".join(
-        sess.exec(
-            select(PaperAuthor.author_email).where(
-                PaperAuthor.paper_id == selected_paper.id
-            )
-        ).all()
+    # Papers of finished conferences are read from the archive
+    view = load_author_paper(sess, account.email, paper_id) or read_archive(
+        lambda archive: load_author_paper(archive, account.email, paper_id)
     )
+    if not view:
+        raise HTTPException(401, "This user does not have access to this paper")
 
-    decision_text = dec.status.value if dec else "Pending"
+    decision_text = view.decision.value if view.decision else "Pending"
 
     return templates.TemplateResponse(
         "author_paperview.html.jinja",
         {
             "request": request,
             "roles": roles,
-            "conference": conf,
             "decision": decision_text,
-            "paper": selected_paper,
-            "authors": authors,
+            "paper": view,
         },
     )
 
 
 @app.get("/author/papersub1")
+@query_budget(3)
 async def author_sub_1(
     request: Request,
     roles: Annotated[Roles, Depends(get_user_roles)],
@@ -130,6 +176,7 @@ async def author_sub_1(
 
 
 @app.get("/author/papersub2")
+@query_budget(2)
 async def author_sub_2(
     request: Request,
     roles: Annotated[Roles, Depends(get_user_roles)],
@@ -150,6 +197,7 @@ async def author_sub_2(
 
 
 @app.post("/author/paper", response_model=Paper, status_code=201)
+@query_budget(8)
 async def paper_create(
     account: Annotated[AccountDTO, Depends(get_current_user)],
     sess: Annotated[Session, Depends(db_session)],
@@ -159,35 +207,40 @@ async def paper_create(
 ):
     """Creates a new paper"""
 
-    authors = authors.split(",")[:-1]
+    authors = [author.strip() for author in authors.split(",")[:-1]]
 
-    # Validate authors
+    # Validate authors in one query, however many there are
+    known = set(sess.exec(select(Account.email).where(Account.email.in_(authors))))
     for author in authors:
-        if not sess.get(Account, author):
+        if author not in known:
             raise HTTPException(400, f"Email: {author} does not exist!")
 
     # Check deadline and ownership
-    if sess.get(Conference, conf_id).paper_deadline < datetime.datetime.utcnow().date():
+    if not (conf := sess.get(Conference, conf_id)):
+        raise HTTPException(404, "Conference does not exist")
+    elif conf.paper_deadline < datetime.datetime.utcnow().date():
         raise HTTPException(400, "Conference submission deadline passed!")
-    elif sess.exec(
-        select(Account)
-        .join(Conference, Conference.id == conf_id)
-        .where(Account.email == Conference.chair)
-    ).first():
+    elif conf.chair == account.email:
         raise HTTPException(400, "Chairs cannot submit to their own conferences!")
 
-    # Add paper
-    paper_rec = Paper(conference_id=conf_id, title=paper_title)
-    sess.add(paper_rec)
-    sess.commit()
+    with Session(conference_engine(conf_id, create=True)) as conf_sess:
+        # Add paper
+        paper_rec = Paper(
+            id=allocate_paper_id(conf_id), conference_id=conf_id, title=paper_title
+        )
+        conf_sess.add(paper_rec)
+        conf_sess.commit()
+
+        # Then add authors
+        author_recs = [
+            PaperAuthor(author_email=email, paper_id=paper_rec.id) for email in authors
+        ]
+        conf_sess.add_all(author_recs)
+        conf_sess.commit()
+        conf_sess.refresh(paper_rec)
 
-    # Then add authors
-    author_recs = [
-        PaperAuthor(author_email=email.strip(), paper_id=paper_rec.id)
-        for email in authors
-    ]
-    sess.add_all(author_recs)
-    sess.commit()
+    # Read from the form, as the records expired on commit
+    record_members(conf_id, authors, MemberRole.author)
 
     return paper_rec
 
@@ -198,49 +251,64 @@ class ReccDTO(BaseModel):
 
 
 @app.put("/assignments", response_model=Assignment)
+@query_budget(6)
 async def recommendation_update(
     account: Annotated[AccountDTO, Depends(get_current_user)],
-    sess: Annotated[Session, Depends(db_session)],
     dto: ReccDTO,
 ):
     """Updates a reviewers recommendation"""
 
-    # Check if chair has already made decision
-    if sess.exec(select(Decision).where(Decision.paper_id == dto.paper_id)).first():
-        raise HTTPException(400, "Chair has already made decision!")
-
-    # Check if user owns assignment
-    if record := sess.exec(
-        select(Assignment)
-        .where(Assignment.paper_id == dto.paper_id)
-        .where(Assignment.reviewer_email == account.email)
-    ).first():
-        # Update recommendation
-        record.recommendation = dto.recommendation
-        sess.add(record)
-        sess.commit()
-        sess.refresh(record)
-    else:
-        # Fail because assignment for this user does not exist
-        raise HTTPException(403, "You do not own this assignment!")
+    with session_for_paper(dto.paper_id) as sess:
+        # Check if chair has already made decision
+        if sess.exec(select(Decision).where(Decision.paper_id == dto.paper_id)).first():
+            raise HTTPException(400, "Chair has already made decision!")
+
+        # Check if user owns assignment
+        if record := sess.exec(
+            select(Assignment)
+            .where(Assignment.paper_id == dto.paper_id)
+            .where(Assignment.reviewer_email == account.email)
+        ).first():
+            # Update recommendation
+            record.recommendation = dto.recommendation
+            sess.add(record)
+            sess.commit()
+            sess.refresh(record)
+        else:
+            # Fail because assignment for this user does not exist
+            raise HTTPException(403, "You do not own this assignment!")
+
+        paper = sess.get(Paper, record.paper_id)
+        await broker.publish(
+            conference_channel(paper.conference_id),
+            {
+                "type": "recommendation",
+                "paper_id": record.paper_id,
+                "reviewer_email": record.reviewer_email,
+                "recommendation": record.recommendation.value,
+            },
+        )
 
-    return record
+        return record
 
 
 @app.get("/assignments")
+@query_budget(4)
 async def assignments_home(
     request: Request,
-    sess: Annotated[Session, Depends(db_session)],
     roles: Annotated[Roles, Depends(get_user_roles)],
     account: Annotated[AccountDTO, Depends(get_current_user)],
 ):
     """Reviewer landing page"""
 
-    assignments = sess.exec(
-        select(Paper, Assignment)
-        .where(Paper.id == Assignment.paper_id)
-        .where(Assignment.reviewer_email == account.email)
-    ).all()
+    assignments = fan_out(
+        lambda sess: sess.exec(
+            select(Paper, Assignment)
+            .where(Paper.id == Assignment.paper_id)
+            .where(Assignment.reviewer_email == account.email)
+        ).all(),
+        history=True,
+    )
 
     return templates.TemplateResponse(
         "reviewer.html.jinja",
@@ -254,56 +322,76 @@ class AssignCreate(BaseModel):
 
 
 @app.post("/assignments", status_code=201, response_model=Assignment)
+@query_budget(10)
 async def assignments_create(
-    sess: Annotated[Session, Depends(db_session)],
     confs: Annotated[list[Conference], Depends(get_owned_conferences)],
     assign: AssignCreate,
 ):
     """Assigns a new author to a paper"""
 
-    paper = sess.get(Paper, assign.paper_id)
-
-    # Unsure reviewer does not own this paper
-    if sess.exec(
-        select(PaperAuthor)
-        .where(PaperAuthor.paper_id == paper.id)
-        .where(PaperAuthor.author_email == assign.email)
-    ).first():
-        raise HTTPException(400, "User cannot review own paper")
-
-    # Ensure user owns conference
-    if paper.conference_id not in (i.id for i in confs):
-        raise HTTPException(403, "User does not own conference")
-
-    # Ensure email exists
-    if not sess.get(Account, assign.email):
-        raise HTTPException(400, "Account does not exist")
-
-    # Ensure only 3 can be assigned
-    assignment_c = len(
-        sess.exec(
-            select(Assignment).where(assign.paper_id == Assignment.paper_id)
-        ).all()
-    )
-    if assignment_c == 3:
-        raise HTTPException(400, "All assignments are already assigned")
+    with session_for_paper(assign.paper_id) as sess:
+        if not (paper := sess.get(Paper, assign.paper_id)):
+            raise missing_paper(assign.paper_id)
+
+        # Unsure reviewer does not own this paper
+        if sess.exec(
+            select(PaperAuthor)
+            .where(PaperAuthor.paper_id == paper.id)
+            .where(PaperAuthor.author_email == assign.email)
+        ).first():
+            raise HTTPException(400, "User cannot review own paper")
+
+        # Ensure user owns conference
+        if paper.conference_id not in (i.id for i in confs):
+            raise HTTPException(403, "User does not own conference")
+
+        # Read before commit expires paper
+        conf_id = paper.conference_id
+        channel = conference_channel(conf_id)
+
+        # Ensure email exists
+        if not sess.get(Account, assign.email):
+            raise HTTPException(400, "Account does not exist")
+
+        # Ensure only 3 can be assigned
+        assignment_c = len(
+            sess.exec(
+                select(Assignment).where(assign.paper_id == Assignment.paper_id)
+            ).all()
+        )
+        if assignment_c == 3:
+            raise HTTPException(400, "All assignments are already assigned")
+
+        # Ensure reviewer can only be assigned once
+        if sess.exec(
+            select(Assignment)
+            .where(assign.paper_id == Assignment.paper_id)
+            .where(Assignment.reviewer_email == assign.email)
+        ).first():
+            raise HTTPException(400, "Reviewer already assigned to paper")
+
+        record = Assignment(reviewer_email=assign.email, paper_id=assign.paper_id)
+        sess.add(record)
+        sess.commit()
+        sess.refresh(record)
 
-    # Ensure reviewer can only be assigned once
-    if sess.exec(
-        select(Assignment)
-        .where(assign.paper_id == Assignment.paper_id)
-        .where(Assignment.reviewer_email == assign.email)
-    ).first():
-        raise HTTPException(400, "Reviewer already assigned to paper")
+        record_members(conf_id, [assign.email], MemberRole.reviewer)
 
-    record = Assignment(reviewer_email=assign.email, paper_id=assign.paper_id)
-    sess.add(record)
-    sess.commit()
+        await broker.publish(
+            channel,
+            {
+                "type": "assignment",
+                "paper_id": assign.paper_id,
+                "reviewer_email": assign.email,
+                "recommendation": Recommendation.pending.value,
+            },
+        )
 
-    return record
+        return record
 
 
 @app.get("/conferences")
+@query_budget(3)
 async def chair_home(
     request: Request,
     roles: Annotated[Roles, Depends(get_user_roles)],
@@ -318,9 +406,10 @@ async def chair_home(
 
 
 @app.get("/conferences/papers")
+@query_budget(5)
 async def chair_paperlist(
     request: Request,
-    sess: Annotated[Session, Depends(db_session)],
+    sess: Annotated[Session | None, Depends(conf_db_session)],
     roles: Annotated[Roles, Depends(get_user_roles)],
     conf_id: int,
     confs: Annotated[list[Conference], Depends(get_owned_conferences)],
@@ -331,55 +420,50 @@ async def chair_paperlist(
     if conf_id not in (i.id for i in confs):
         raise HTTPException(403, "User does not own conference")
 
-    res = sess.exec(
-        select(Paper, Decision)
-        .where(Paper.conference_id == conf_id)
-        .outerjoin(Decision, Decision.paper_id == Paper.id)
-    ).all()
+    def papers(s: Session):
+        return s.exec(
+            select(Paper, Decision)
+            .where(Paper.conference_id == conf_id)
+            .outerjoin(Decision, Decision.paper_id == Paper.id)
+        ).all()
+
+    # Finished conferences have their papers in the archive
+    res = (sess and papers(sess)) or read_archive(papers) or []
 
     return templates.TemplateResponse(
         "chair_paperlist.html.jinja",
-        {"request": request, "roles": roles, "res": res},
+        {"request": request, "roles": roles, "res": res, "conf_id": conf_id},
     )
 
 
 @app.get("/conferences/paper")
+@query_budget(4)
 async def chair_paperview(
     request: Request,
-    sess: Annotated[Session, Depends(db_session)],
+    sess: Annotated[Session, Depends(paper_db_session)],
     roles: Annotated[Roles, Depends(get_user_roles)],
+    account: Annotated[AccountDTO, Depends(get_current_user)],
     paper_id: int,
-    confs: Annotated[list[Conference], Depends(get_owned_conferences)],
 ):
     """Chair paper level view"""
 
-    (paper, decision) = sess.exec(
-        select(Paper, Decision)
-        .where(Paper.id == paper_id)
-        .outerjoin(Decision, Decision.paper_id == Paper.id)
-    ).first()
+    # Papers of finished conferences are read from the archive, and can no longer be changed
+    if archived := not (view := load_chair_paper(sess, paper_id)):
+        view = read_archive(lambda archive: load_chair_paper(archive, paper_id))
+    if not view:
+        raise HTTPException(404, "Paper does not exist")
 
     # Ensure paper in owned conference
-    if paper.conference_id not in (i.id for i in confs):
+    if view.conference_chair != account.email:
         raise HTTPException(403, "User does not own conference")
 
-    assignments = sess.exec(
-        select(Assignment).where(Assignment.paper_id == paper_id)
-    ).all()
-
-    conf = sess.get(Conference, paper.conference_id)
-
-    authors = ",".join(
-        sess.exec(
-            select(PaperAuthor.author_email).where(PaperAuthor.paper_id == paper_id)
-        ).all()
-    )
+    assignments = view.assignments
 
     # Determining recommended decision
     decision_str = "so not publish"
     # If decision is made, then use it
-    if decision:
-        decision_str = decision.status.value
+    if view.decision:
+        decision_str = view.decision.value
     else:
         # If not all reviews are in, it's pending
         if len(assignments) < 3 or Recommendation.pending in (
@@ -401,62 +485,100 @@ async def chair_paperview(
         {
             "request": request,
             "roles": roles,
-            "paper": paper,
+            "paper": view,
             "decision": decision_str,
             "assignments": assignments,
             "assignment_count": len(assignments),
-            "conference": conf,
-            "authors": authors,
+            "archived": archived,
         },
     )
 
 
+@app.get("/conferences/events")
+@query_budget(2)
+async def chair_events(
+    request: Request,
+    conf_id: int,
+    confs: Annotated[list[Conference], Depends(get_owned_conferences)],
+):
+    """Server-sent event stream of review activity in a conference"""
+
+    # Ensure user owns conference
+    if conf_id not in (i.id for i in confs):
+        raise HTTPException(403, "User does not own conference")
+
+    return StreamingResponse(
+        event_stream(conference_channel(conf_id), request.is_disconnected),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 class DecisionDTO(BaseModel):
     decision: DecisionStatus
     paper_id: int
 
 
 @app.post("/decision", response_model=Decision)
+@query_budget(7)
 async def decision_update(
-    sess: Annotated[Session, Depends(db_session)],
     decision: DecisionDTO,
     confs: Annotated[list[Conference], Depends(get_owned_conferences)],
 ):
     """Creates or updates a decision"""
 
-    paper = sess.get(Paper, decision.paper_id)
-    conf = sess.get(Conference, paper.conference_id)
+    with session_for_paper(decision.paper_id) as sess:
+        if not (paper := sess.get(Paper, decision.paper_id)):
+            raise missing_paper(decision.paper_id)
+        conf = sess.get(Conference, paper.conference_id)
 
-    # Ensure paper in owned conference
-    if paper.conference_id not in (i.id for i in confs):
-        raise HTTPException(403, "User does not own conference")
+        # Ensure paper in owned conference
+        if paper.conference_id not in (i.id for i in confs):
+            raise HTTPException(403, "User does not own conference")
 
-    # Ensure conference has not started
-    if datetime.datetime.utcnow().date() > conf.start_date:
-        raise HTTPException(400, "Cannot change decision after conference has started")
+        # Ensure conference has not started
+        if datetime.datetime.utcnow().date() > conf.start_date:
+            raise HTTPException(
+                400, "Cannot change decision after conference has started"
+            )
 
-    # Update or create record
-    if record := sess.exec(
-        select(Decision).where(Decision.paper_id == decision.paper_id)
-    ).first():
-        record.status = decision.decision
-        sess.add(record)
-        sess.commit()
-    else:
-        record = Decision(status=decision.decision, paper_id=decision.paper_id)
-        sess.add(record)
-        sess.commit()
+        channel = conference_channel(paper.conference_id)
+
+        # Update or create record
+        if record := sess.exec(
+            select(Decision).where(Decision.paper_id == decision.paper_id)
+        ).first():
+            record.status = decision.decision
+            sess.add(record)
+            sess.commit()
+        else:
+            record = Decision(status=decision.decision, paper_id=decision.paper_id)
+            sess.add(record)
+            sess.commit()
+
+        sess.refresh(record)
+
+        await broker.publish(
+            channel,
+            {
+                "type": "decision",
+                "paper_id": decision.paper_id,
+                "status": decision.decision.value,
+            },
+        )
 
-    return record
+        return record
 
 
 @app.get("/login")
+@query_budget(0)
 async def login(request: Request, not_login=Depends(ensure_user_not_logged_in)):
     """Login page. Will redirect to home if already logged in."""
     return templates.TemplateResponse("login.html.jinja", {"request": request})
 
 
 @app.post("/token", response_model=Token)
+@query_budget(1)
 async def create_token(
     form: Annotated[OAuth2PasswordRequestForm, Depends()], response: Response
 ):
@@ -475,6 +597,7 @@ async def create_token(
 
 
 @app.get("/logout")
+@query_budget(0)
 async def logout():
     """Destroys the login token"""
     response = RedirectResponse(url="/login")
@@ -0,0 +1,189 @@
+from typing import Annotated
+
+import orjson
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import ORJSONResponse
+from sqlalchemy import func, case
+from sqlmodel import Session, select
+
+from .deps import db_session, get_current_user
+from .orm.connect import conference_engine, fan_out, read_archive
+from .orm.model import (
+    AccountDTO,
+    Paper,
+    PaperAuthor,
+    Assignment,
+    Conference,
+    Decision,
+    Recommendation,
+)
+from .orm.querylog import query_budget
+
+
+class APIResponse(ORJSONResponse):
+    """JSON response serialized straight from rows. Dates and enums are handled natively by orjson."""
+
+    def render(self, content) -> bytes:
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+
+
+router = APIRouter(prefix="/api/v1", default_response_class=APIResponse)
+
+# Selectable fields of each resource
+paper_fields = {
+    "id": Paper.id,
+    "conference_id": Paper.conference_id,
+    "title": Paper.title,
+    "decision": Decision.status,
+}
+
+assignment_fields = {
+    "paper_id": Assignment.paper_id,
+    "conference_id": Paper.conference_id,
+    "title": Paper.title,
+    "recommendation": Assignment.recommendation,
+}
+
+conference_fields = {
+    "id": Conference.id,
+    "name": Conference.name,
+    "city": Conference.city,
+    "state": Conference.state,
+    "country": Conference.country,
+    "start_date": Conference.start_date,
+    "end_date": Conference.end_date,
+    "paper_deadline": Conference.paper_deadline,
+    "chair": Conference.chair,
+}
+
+
+def _count_of(recommendation: Recommendation):
+    return func.sum(case((Assignment.recommendation == recommendation, 1), else_=0))
+
+
+review_fields = {
+    "paper_id": Paper.id,
+    "title": Paper.title,
+    "decision": Decision.status,
+    "reviewers": func.count(Assignment.reviewer_email),
+    **{rec.value: _count_of(rec) for rec in Recommendation},
+}
+
+
+def select_fields(available: dict, fields: str | None) -> dict:
+    """Picks the requested comma separated fields, or all of them. 400s on unknown fields."""
+    if not fields:
+        return available
+
+    names = [name.strip() for name in fields.split(",")]
+    if unknown := [name for name in names if name not in available]:
+        raise HTTPException(400, f"Unknown fields: {','.join(unknown)}")
+
+    return {name: available[name] for name in names}
+
+
+def as_dicts(columns: dict, rows) -> list[dict]:
+    keys = list(columns)
+    return [dict(zip(keys, row)) for row in rows]
+
+
+@router.get("/papers")
+@query_budget(3)
+async def api_papers(
+    account: Annotated[AccountDTO, Depends(get_current_user)],
+    fields: str | None = None,
+):
+    """Papers authored by the user"""
+    columns = select_fields(paper_fields, fields)
+
+    rows = fan_out(
+        lambda sess: sess.execute(
+            select(*columns.values())
+            .select_from(Paper)
+            .join(PaperAuthor, PaperAuthor.paper_id == Paper.id)
+            .outerjoin(Decision, Decision.paper_id == Paper.id)
+            .where(PaperAuthor.author_email == account.email)
+        ).all(),
+        history=True,
+    )
+
+    return APIResponse(as_dicts(columns, rows))
+
+
+@router.get("/assignments")
+@query_budget(3)
+async def api_assignments(
+    account: Annotated[AccountDTO, Depends(get_current_user)],
+    fields: str | None = None,
+):
+    """Papers assigned to the user for review"""
+    columns = select_fields(assignment_fields, fields)
+
+    rows = fan_out(
+        lambda sess: sess.execute(
+            select(*columns.values())
+            .select_from(Assignment)
+            .join(Paper, Paper.id == Assignment.paper_id)
+            .where(Assignment.reviewer_email == account.email)
+        ).all(),
+        history=True,
+    )
+
+    return APIResponse(as_dicts(columns, rows))
+
+
+@router.get("/conferences")
+@query_budget(2)
+async def api_conferences(
+    account: Annotated[AccountDTO, Depends(get_current_user)],
+    sess: Annotated[Session, Depends(db_session)],
+    owned: bool = False,
+    fields: str | None = None,
+):
+    """All conferences, or only those chaired by the user"""
+    columns = select_fields(conference_fields, fields)
+
+    query = select(*columns.values())
+    if owned:
+        query = query.where(Conference.chair == account.email)
+
+    return APIResponse(as_dicts(columns, sess.execute(query).all()))
+
+
+@router.get("/conferences/{conf_id}/reviews")
+@query_budget(4)
+async def api_reviews(
+    account: Annotated[AccountDTO, Depends(get_current_user)],
+    sess: Annotated[Session, Depends(db_session)],
+    conf_id: int,
+    fields: str | None = None,
+):
+    """Review progress of each paper in a conference owned by the user"""
+    columns = select_fields(review_fields, fields)
+
+    # Ensure user owns conference
+    if (
+        sess.execute(select(Conference.chair).where(Conference.id == conf_id)).scalar()
+        != account.email
+    ):
+        raise HTTPException(403, "User does not own conference")
+
+    def reviews(s: Session):
+        return s.execute(
+            select(*columns.values())
+            .select_from(Paper)
+            .outerjoin(Decision, Decision.paper_id == Paper.id)
+            .outerjoin(Assignment, Assignment.paper_id == Paper.id)
+            .where(Paper.conference_id == conf_id)
+            .group_by(Paper.id)
+        ).all()
+
+    rows = []
+    if eng := conference_engine(conf_id):
+        with Session(eng) as conf_sess:
+            rows = reviews(conf_sess)
+
+    # Finished conferences have their papers in the archive
+    rows = rows or read_archive(reviews) or []
+
+    return APIResponse(as_dicts(columns, rows))
@@ -7,8 +7,8 @@ from sqlmodel import Session, select
 from starlette import status
 from starlette.requests import Request
 
-from .orm.connect import engine
-from .orm.model import Account, AccountDTO, Paper, PaperAuthor, Conference
+from .orm.connect import engine, conference_engine, paper_engine, read_archive
+from .orm.model import Account, AccountDTO, Conference, Paper
 from .security.token import decode, OAuth2PasswordBearerWithCookie
 from .orm import utils
 
@@ -22,6 +22,44 @@ def db_session() -> Session:
         sess.close()
 
 
+def session_for_paper(paper_id: int) -> Session:
+    """Opens a session on the database holding a paper. 404s if the paper does not exist in sharded mode."""
+    eng = paper_engine(paper_id)
+    if not eng:
+        raise HTTPException(404, "Paper does not exist")
+    return Session(eng)
+
+
+def missing_paper(paper_id: int) -> HTTPException:
+    """The error for a paper not in the hot tables. Papers of archived conferences can be read, but not changed."""
+    if read_archive(lambda archive: archive.get(Paper, paper_id)):
+        return HTTPException(409, "Conference is archived")
+    return HTTPException(404, "Paper does not exist")
+
+
+def paper_db_session(paper_id: int) -> Session:
+    """Creates a db session routed by the paper_id query parameter"""
+    with session_for_paper(paper_id) as sess:
+        yield sess
+
+
+def conf_db_session(conf_id: int) -> Session | None:
+    """
+    Creates a db session routed by the conf_id query parameter.
+    None in sharded mode if the conference has no papers yet, 404s if it does not exist.
+    """
+    eng = conference_engine(conf_id)
+    if not eng:
+        with Session(engine) as sess:
+            if not sess.get(Conference, conf_id):
+                raise HTTPException(404, "Conference does not exist")
+        yield None
+        return
+
+    with Session(eng) as sess:
+        yield sess
+
+
 oauth2_scheme = OAuth2PasswordBearerWithCookie(tokenUrl="token")
 
 
@@ -35,14 +73,16 @@ async def get_current_user(
     If the user has an invalid token, they are logged out, then sent to the logon page.
     """
     data = decode(token)
-    if not data:
+    # Tokens can outlive their account
+    account = data and db.get(Account, data.email)
+    if not account:
         # If token bad, force user to destroy cookie to simplify
         raise HTTPException(
             status_code=status.HTTP_307_TEMPORARY_REDIRECT,
             detail="Not authenticated",
             headers={"WWW-Authenticate": "Bearer", "Location": "/logout"},
         )
-    return AccountDTO.from_orm(db.get(Account, data.email))
+    return AccountDTO.from_orm(account)
 
 
 async def get_user_roles(
@@ -66,26 +106,6 @@ async def ensure_user_not_logged_in(request: Request):
             raise redirect
 
 
-async def get_user_owned_paper(
-    account: Annotated[AccountDTO, Depends(get_current_user)],
-    sess: Annotated[Session, Depends(db_session)],
-    paper_id: int,
-) -> Paper:
-    """Gets a paper owned by the user. 401s if user does not own, or it does not exist."""
-    # Selects a paper with the selected author and paper ids
-    res = sess.exec(
-        select(Paper)
-        .join(PaperAuthor, PaperAuthor.paper_id == Paper.id)
-        .where(PaperAuthor.author_email == account.email)
-        .where(Paper.id == paper_id)
-    ).first()
-
-    if res:
-        return res
-    else:
-        raise HTTPException(401, "This user does not have access to this paper")
-
-
 async def get_avil_conferences(
     sess: Annotated[Session, Depends(db_session)],
 ) -> list[Conference]:
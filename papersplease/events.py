@@ -0,0 +1,168 @@
+import asyncio
+import importlib
+import json
+import logging
+import multiprocessing
+import os
+from abc import ABC, abstractmethod
+from typing import AsyncIterator, Callable
+
+logger = logging.getLogger(__name__)
+
+Deliver = Callable[[str, str], None]
+"""Callback a backend uses to hand a (channel, message) pair to the local broker"""
+
+
+class BrokerBackend(ABC):
+    """
+    Transport between brokers. Every published message must be delivered to the
+    broker of every worker, including the one that published it.
+    """
+
+    @abstractmethod
+    async def start(self, deliver: Deliver):
+        """Starts the backend. Received messages are passed to deliver."""
+
+    @abstractmethod
+    async def publish(self, channel: str, message: str):
+        """Sends a message to all brokers listening on this backend"""
+
+    async def stop(self):
+        """Stops the backend"""
+
+
+class LocalBackend(BrokerBackend):
+    """In-process backend. Only suitable for a single worker, or tests."""
+
+    def __init__(self):
+        self.deliver: Deliver | None = None
+
+    async def start(self, deliver: Deliver):
+        self.deliver = deliver
+
+    async def publish(self, channel: str, message: str):
+        if self.deliver:
+            self.deliver(channel, message)
+
+
+RESYNC = "resync"
+"""Queued in place of a lagged subscriber's dropped backlog"""
+
+
+class Subscription:
+    """A single client listening on a channel"""
+
+    def __init__(self, max_pending: int):
+        self.queue: asyncio.Queue[str] = asyncio.Queue(max_pending)
+        self.lagged = False
+
+    def push(self, message: str):
+        """Queues a message. Slow clients are marked lagged instead of buffering without bound."""
+        if self.lagged:
+            return
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            # Drop everything queued, the client will have to resync from scratch
+            self.lagged = True
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(RESYNC)
+
+
+class Broker:
+    """Fans out published events to local subscribers"""
+
+    def __init__(self, backend: BrokerBackend, max_pending: int = 64):
+        self.backend = backend
+        self.max_pending = max_pending
+        self.channels: dict[str, set[Subscription]] = {}
+
+    async def start(self):
+        if isinstance(self.backend, LocalBackend) and _multiple_workers():
+            logger.warning(
+                "Events are only delivered within this worker, so chairs miss events published on other workers. "
+                "Set PAPERSPLEASE_BROKER_BACKEND to a backend shared between workers."
+            )
+        await self.backend.start(self.deliver)
+
+    async def stop(self):
+        await self.backend.stop()
+
+    def deliver(self, channel: str, message: str):
+        """Pushes a message to every local subscriber of a channel"""
+        for sub in self.channels.get(channel, ()):
+            sub.push(message)
+
+    async def publish(self, channel: str, event: dict):
+        """Publishes a JSON event on a channel"""
+        await self.backend.publish(channel, json.dumps(event))
+
+    def subscribe(self, channel: str) -> Subscription:
+        sub = Subscription(self.max_pending)
+        self.channels.setdefault(channel, set()).add(sub)
+        return sub
+
+    def unsubscribe(self, channel: str, sub: Subscription):
+        subs = self.channels.get(channel)
+        if subs is not None:
+            subs.discard(sub)
+            if not subs:
+                del self.channels[channel]
+
+
+def conference_channel(conf_id: int) -> str:
+    """Channel name for events scoped to a conference"""
+    return f"conference:{conf_id}"
+
+
+def _multiple_workers() -> bool:
+    """If this process may be one of several workers, as started by uvicorn or gunicorn --workers"""
+    return int(os.environ.get("WEB_CONCURRENCY", 1)) > 1 or multiprocessing.parent_process() is not None
+
+
+def backend_from_env() -> BrokerBackend:
+    """
+    Creates the backend named by PAPERSPLEASE_BROKER_BACKEND, as module:Class of a BrokerBackend taking no arguments.
+    Defaults to LocalBackend.
+    """
+    if not (path := os.environ.get("PAPERSPLEASE_BROKER_BACKEND")):
+        return LocalBackend()
+
+    module, _, name = path.partition(":")
+    backend = getattr(importlib.import_module(module), name)()
+    if not isinstance(backend, BrokerBackend):
+        raise TypeError(f"{path} is not a BrokerBackend")
+
+    return backend
+
+
+broker = Broker(backend_from_env())
+"""Primary event broker"""
+
+
+async def event_stream(
+    channel: str, is_disconnected: Callable, keepalive: float = 15
+) -> AsyncIterator[str]:
+    """
+    Yields server-sent events for a channel until the client disconnects.
+    Clients that fall too far behind are sent a resync event, then closed.
+    """
+    sub = broker.subscribe(channel)
+    try:
+        while not await is_disconnected():
+            try:
+                message = await asyncio.wait_for(sub.queue.get(), keepalive)
+            except asyncio.TimeoutError:
+                # Comment line keeps proxies from timing out the connection
+                yield ": keepalive\n\n"
+                continue
+
+            if message is RESYNC:
+                logger.info("Dropping lagged subscriber on %s", channel)
+                yield "event: resync\ndata: {}\n\n"
+                return
+
+            yield f"data: {message}\n\n"
+    finally:
+        broker.unsubscribe(channel, sub)
@@ -0,0 +1,240 @@
+"""
+Moves finished conferences out of the hot tables.
+
+Papers, authors, assignments and decisions of a conference whose end date has passed are copied to the archive
+database, which is only ever opened read only by the app, and an immutable gzip JSON snapshot is written alongside.
+Run as `python -m papersplease.orm.archive` to archive, or with --verify to check snapshots against their digests.
+"""
+import argparse
+import contextlib
+import datetime
+import enum
+import gzip
+import hashlib
+import json
+import os
+
+from sqlalchemy import Table, delete, false, insert, text, tuple_
+from sqlalchemy.engine import Connection, Engine
+from sqlmodel import create_engine, SQLModel, Session, select
+
+from .connect import engine, conference_engine, archive_file_name, shard_tables
+from .model import Conference, Paper, PaperAuthor, Assignment, Decision, ArchivedConference
+
+snapshot_dir = "snapshots"
+
+
+def _writer() -> Engine:
+    """Opens the archive for writing, creating it if needed. Archived rows cannot be updated or deleted."""
+    writer = create_engine(f"sqlite:///{archive_file_name}")
+    SQLModel.metadata.create_all(writer, tables=shard_tables)
+
+    with writer.begin() as conn:
+        for table in shard_tables:
+            for op in ("UPDATE", "DELETE"):
+                conn.execute(text(
+                    f"CREATE TRIGGER IF NOT EXISTS {table.name}_no_{op.lower()} BEFORE {op} ON {table.name} "
+                    f"BEGIN SELECT RAISE(ABORT, 'archive is read only'); END"
+                ))
+
+    return writer
+
+
+def _conference_filters(conf_id: int) -> dict:
+    """Criteria selecting a conferences rows in each conference scoped table, parents first"""
+    papers = select(Paper.id).where(Paper.conference_id == conf_id)
+    return {
+        Paper.__table__: Paper.conference_id == conf_id,
+        PaperAuthor.__table__: PaperAuthor.paper_id.in_(papers),
+        Assignment.__table__: Assignment.paper_id.in_(papers),
+        Decision.__table__: Decision.paper_id.in_(papers),
+    }
+
+
+def _conference_rows(sess: Session, filters: dict) -> dict[Table, list[dict]]:
+    """Every row matching the filters of each table"""
+    return {
+        table: [dict(r) for r in sess.execute(select(table).where(where)).mappings()]
+        for table, where in filters.items()
+    }
+
+
+def _lock_for_writing(sess: Session, table: Table):
+    """
+    Starts a write transaction on the database holding table, so other writers wait until it commits.
+    BEGIN IMMEDIATE would also lock every attached database, the global one included in sharded mode.
+    """
+    sess.execute(delete(table).where(false()))
+
+
+class ArchiveConflict(Exception):
+    """A row being archived clashes with a different row already in the archive, such as a reused paper id"""
+
+
+def _archived_rows(conn: Connection, table: Table, rows: list[dict], chunk: int = 500) -> dict[tuple, dict]:
+    """Rows already in the archive with the same primary keys as rows, by key"""
+    pk = list(table.primary_key.columns)
+    keys = [tuple(row[col.name] for col in pk) for row in rows]
+
+    found = {}
+    for i in range(0, len(keys), chunk):
+        for row in conn.execute(select(table).where(tuple_(*pk).in_(keys[i:i + chunk]))).mappings():
+            found[tuple(row[col.name] for col in pk)] = dict(row)
+
+    return found
+
+
+def _copy_rows(conn: Connection, table: Table, rows: list[dict]):
+    """
+    Copies rows into the archive. Rows left over from a failed run are skipped if identical.
+    Raises ArchiveConflict on any other clash, or if any row did not make it.
+    """
+    pk = [col.name for col in table.primary_key.columns]
+    archived = _archived_rows(conn, table, rows)
+
+    new = []
+    for row in rows:
+        key = tuple(row[name] for name in pk)
+        if key not in archived:
+            new.append(row)
+        elif archived[key] != row:
+            raise ArchiveConflict(f"{table.name} {key} is already archived with different data")
+
+    if new:
+        conn.execute(insert(table), new)
+
+    # Never let the hot rows be deleted unless every one is archived
+    if len(_archived_rows(conn, table, rows)) != len(rows):
+        raise ArchiveConflict(f"Only some {table.name} rows were archived")
+
+
+def _encode(value):
+    if isinstance(value, enum.Enum):
+        return value.value
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()
+    raise TypeError(f"Cannot snapshot {type(value)}")
+
+
+def _write_snapshot(conf: Conference, rows: dict[Table, list[dict]], archived_at: datetime.datetime) -> tuple[str, str]:
+    """Writes a read only, compressed snapshot of a conference. Returns its path and sha256."""
+    os.makedirs(snapshot_dir, exist_ok=True)
+    path = os.path.join(snapshot_dir, f"conference_{conf.id}_{archived_at:%Y%m%dT%H%M%S}.json.gz")
+
+    payload = json.dumps(
+        {
+            "conference": conf.dict(),
+            "archived_at": archived_at,
+            "tables": {table.name: table_rows for table, table_rows in rows.items()},
+        },
+        default=_encode,
+        sort_keys=True,
+    ).encode()
+
+    # mtime is fixed so the same data always gives the same digest
+    with gzip.GzipFile(path, "wb", mtime=0) as f:
+        f.write(payload)
+    os.chmod(path, 0o444)
+
+    with open(path, "rb") as f:
+        return path, hashlib.sha256(f.read()).hexdigest()
+
+
+def archive_conference(conf_id: int, writer: Engine | None = None) -> ArchivedConference:
+    """
+    Moves a conference from the hot tables into the archive.
+    Writers to the conference database wait until the move commits, the global database is not held in sharded mode.
+    """
+    writer = writer or _writer()
+    archived_at = datetime.datetime.utcnow()
+
+    with Session(engine) as sess:
+        conf = sess.get(Conference, conf_id)
+
+    filters = _conference_filters(conf_id)
+    # A conference that never had papers has no database in sharded mode
+    hot_engine = conference_engine(conf_id)
+
+    with Session(hot_engine) if hot_engine else contextlib.nullcontext() as hot:
+        if hot:
+            # Routes must not change the rows between reading and deleting them, or the change is lost
+            _lock_for_writing(hot, Paper.__table__)
+
+        rows = _conference_rows(hot, filters) if hot else {table: [] for table in filters}
+
+        # Copy into the archive first, so a failure part way through never loses data
+        with writer.begin() as conn:
+            for table, table_rows in rows.items():
+                _copy_rows(conn, table, table_rows)
+
+        path, digest = _write_snapshot(conf, rows, archived_at)
+
+        if hot:
+            # Children first
+            for table in reversed(rows):
+                hot.execute(delete(table).where(filters[table]))
+            hot.commit()
+
+    record = ArchivedConference(conference_id=conf_id, archived_at=archived_at, snapshot=path, sha256=digest)
+    with Session(engine) as sess:
+        sess.add(record)
+        sess.commit()
+        sess.refresh(record)
+
+    return record
+
+
+def archive_finished(today: datetime.date | None = None) -> list[ArchivedConference]:
+    """Archives every conference that ended before today, and has not been archived yet"""
+    today = today or datetime.datetime.utcnow().date()
+
+    with Session(engine) as sess:
+        conf_ids = sess.exec(
+            select(Conference.id)
+            .where(Conference.end_date < today)
+            .where(Conference.id.not_in(select(ArchivedConference.conference_id)))
+        ).all()
+
+    if not conf_ids:
+        return []
+
+    writer = _writer()
+    try:
+        return [archive_conference(conf_id, writer) for conf_id in conf_ids]
+    finally:
+        writer.dispose()
+
+
+def verify_snapshots() -> list[ArchivedConference]:
+    """Checks every snapshot against its recorded digest. Returns those that are missing or do not match."""
+    with Session(engine) as sess:
+        records = sess.exec(select(ArchivedConference)).all()
+
+    bad = []
+    for record in records:
+        try:
+            with open(record.snapshot, "rb") as f:
+                ok = hashlib.sha256(f.read()).hexdigest() == record.sha256
+        except FileNotFoundError:
+            ok = False
+
+        if not ok:
+            bad.append(record)
+
+    return bad
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--verify", action="store_true", help="verify snapshots instead of archiving")
+    args = parser.parse_args()
+
+    engine.echo = False
+    if args.verify:
+        bad = verify_snapshots()
+        for record in bad:
+            print(f"conference {record.conference_id}: snapshot {record.snapshot} is missing or modified")
+        raise SystemExit(1 if bad else 0)
+
+    for record in archive_finished():
+        print(f"archived conference {record.conference_id} to {record.snapshot}")
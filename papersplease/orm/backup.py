@@ -0,0 +1,238 @@
+"""
+Online backups of every database, taken while the app keeps serving.
+
+Databases are copied with SQLite's online backup API, checked, then gzipped into a timestamped snapshot directory with
+a manifest of digests. The app runs its databases in WAL mode, see connect.JOURNAL_MODE, where a copy reads from a
+snapshot and never blocks writers. Others, like the archive, are copied a few pages at a time, pausing between steps so
+writers are never locked out for long.
+
+    python -m papersplease.orm.backup snapshot [--keep 7]
+    python -m papersplease.orm.backup verify backups/20240101T000000000000
+    python -m papersplease.orm.backup restore backups/20240101T000000000000
+"""
+import argparse
+import asyncio
+import datetime
+import glob
+import gzip
+import hashlib
+import json
+import logging
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+
+from .connect import sqlite_file_name, shard_dir, archive_file_name
+
+logger = logging.getLogger(__name__)
+
+backup_dir = "backups"
+
+MANIFEST = "manifest.json"
+
+
+def database_files() -> list[str]:
+    """Every database file the app uses, relative to the working directory"""
+    files = [sqlite_file_name, *sorted(glob.glob(os.path.join(shard_dir, "*.sqlite")))]
+    if os.path.exists(archive_file_name):
+        files.append(archive_file_name)
+
+    return files
+
+
+def _sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(1 << 20):
+            digest.update(chunk)
+
+    return digest.hexdigest()
+
+
+def _integrity_ok(path: str) -> bool:
+    with sqlite3.connect(path) as conn:
+        return conn.execute("PRAGMA integrity_check").fetchone()[0] == "ok"
+
+
+class _TooManyRestarts(Exception):
+    pass
+
+
+def copy_database(src: str, dest: str, pages: int = 256, pause: float = 0.005, max_restarts: int = 3):
+    """
+    Copies a live database with the online backup API.
+    Copies pages at a time, sleeping between steps to release the database lock and the GIL.
+
+    A write from another connection restarts the copy. After max_restarts, the database is busy enough
+    that a stepped copy may never finish, so the rest is copied in one step, holding off writers until it is done.
+
+    Databases in WAL mode are always copied in one step, as the copy then only holds a read snapshot,
+    which never blocks writers.
+    """
+    restarts = 0
+    last_remaining = None
+
+    def step(status, remaining, total):
+        nonlocal restarts, last_remaining
+        if last_remaining is not None and remaining > last_remaining:
+            restarts += 1
+            if restarts > max_restarts:
+                raise _TooManyRestarts
+        last_remaining = remaining
+        time.sleep(pause)
+
+    src_conn = sqlite3.connect(src)
+    dest_conn = sqlite3.connect(dest)
+    if src_conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal":
+        pages = -1
+
+    try:
+        try:
+            src_conn.backup(dest_conn, pages=pages, progress=step)
+        except _TooManyRestarts:
+            logger.warning("Backup of %s restarted %d times by writes, copying in one step", src, max_restarts)
+            src_conn.backup(dest_conn)
+    finally:
+        dest_conn.close()
+        src_conn.close()
+
+
+def backup_database(src: str, dest: str, pages: int = 256, pause: float = 0.005):
+    """Copies a live database into a gzipped file, checking the copy first"""
+    with tempfile.TemporaryDirectory() as tmp:
+        copy = os.path.join(tmp, "copy.sqlite")
+        copy_database(src, copy, pages, pause)
+
+        if not _integrity_ok(copy):
+            raise RuntimeError(f"Backup of {src} failed its integrity check")
+
+        # Compressing never touches the live database
+        with open(copy, "rb") as f_in, gzip.open(dest, "wb", compresslevel=6) as f_out:
+            shutil.copyfileobj(f_in, f_out, 1 << 20)
+
+
+def snapshot(out_dir: str = backup_dir, keep: int = 7, pages: int = 256, pause: float = 0.005) -> str:
+    """Backs up every database into a new snapshot directory, keeping only the newest `keep` snapshots"""
+    path = os.path.join(out_dir, f"{datetime.datetime.utcnow():%Y%m%dT%H%M%S%f}")
+    os.makedirs(path)
+
+    try:
+        manifest = {}
+        for db in database_files():
+            dest = os.path.join(path, f"{db}.gz")
+            os.makedirs(os.path.dirname(dest), exist_ok=True)
+
+            start = time.perf_counter()
+            backup_database(db, dest, pages, pause)
+            manifest[db] = _sha256(dest)
+            logger.info("Backed up %s in %.1fs", db, time.perf_counter() - start)
+
+        # Written last, so a snapshot without one is incomplete
+        with open(os.path.join(path, MANIFEST), "w") as f:
+            json.dump(manifest, f, indent=2)
+    except BaseException:
+        shutil.rmtree(path, ignore_errors=True)
+        raise
+
+    # Only complete snapshots count, so incomplete ones can never push out good ones
+    complete = sorted(glob.glob(os.path.join(out_dir, "*", MANIFEST)), reverse=True)
+    for old in complete[keep:]:
+        shutil.rmtree(os.path.dirname(old))
+
+    return path
+
+
+def _unpack(snapshot_path: str, db: str, tmp: str) -> str:
+    """Decompresses a database from a snapshot into tmp"""
+    out = os.path.join(tmp, os.path.basename(db))
+    with gzip.open(os.path.join(snapshot_path, f"{db}.gz"), "rb") as f_in, open(out, "wb") as f_out:
+        shutil.copyfileobj(f_in, f_out, 1 << 20)
+
+    return out
+
+
+def verify(snapshot_path: str) -> list[str]:
+    """Checks every database in a snapshot against its digest and SQLite's integrity check. Returns problems found."""
+    try:
+        with open(os.path.join(snapshot_path, MANIFEST)) as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        return ["missing manifest, snapshot is incomplete"]
+
+    problems = []
+    for db, digest in manifest.items():
+        packed = os.path.join(snapshot_path, f"{db}.gz")
+        if not os.path.exists(packed):
+            problems.append(f"{db}: missing")
+        elif _sha256(packed) != digest:
+            problems.append(f"{db}: digest mismatch")
+        else:
+            with tempfile.TemporaryDirectory() as tmp:
+                if not _integrity_ok(_unpack(snapshot_path, db, tmp)):
+                    problems.append(f"{db}: failed integrity check")
+
+    return problems
+
+
+def restore(snapshot_path: str):
+    """
+    Restores every database in a verified snapshot over the live ones.
+    Uses the backup API in one step, so connections the app holds open see the restored data at once.
+    """
+    if problems := verify(snapshot_path):
+        raise RuntimeError(f"Refusing to restore {snapshot_path}: {'; '.join(problems)}")
+
+    with open(os.path.join(snapshot_path, MANIFEST)) as f:
+        manifest = json.load(f)
+
+    for db in manifest:
+        with tempfile.TemporaryDirectory() as tmp:
+            src_conn = sqlite3.connect(_unpack(snapshot_path, db, tmp))
+            os.makedirs(os.path.dirname(db) or ".", exist_ok=True)
+            dest_conn = sqlite3.connect(db)
+            try:
+                src_conn.backup(dest_conn)
+            finally:
+                dest_conn.close()
+                src_conn.close()
+
+
+async def backup_loop(interval: float, keep: int = 7):
+    """Takes a snapshot every interval seconds, off the event loop"""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            path = await asyncio.to_thread(snapshot, backup_dir, keep)
+            logger.info("Wrote snapshot %s", path)
+        except Exception:
+            logger.exception("Scheduled backup failed")
+
+
+def backup_interval() -> float | None:
+    """Seconds between scheduled snapshots from PAPERSPLEASE_BACKUP_INTERVAL, if set"""
+    interval = os.environ.get("PAPERSPLEASE_BACKUP_INTERVAL")
+    return float(interval) if interval else None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    snap = commands.add_parser("snapshot", help="back up every database")
+    snap.add_argument("--keep", type=int, default=7, help="snapshots to keep")
+    commands.add_parser("verify", help="check a snapshot").add_argument("snapshot")
+    commands.add_parser("restore", help="restore a snapshot over the live databases").add_argument("snapshot")
+    args = parser.parse_args()
+
+    if args.command == "snapshot":
+        print(snapshot(keep=args.keep))
+    elif args.command == "verify":
+        problems = verify(args.snapshot)
+        for problem in problems:
+            print(problem)
+        raise SystemExit(1 if problems else 0)
+    else:
+        restore(args.snapshot)
+        print(f"restored {args.snapshot}")
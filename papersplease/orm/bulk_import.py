@@ -0,0 +1,192 @@
+"""
+Bulk account import from CSV.
+
+Expects a header of email, first_name, last_name, title and affiliation, with an optional password column. A single
+name column may be given in place of first_name and last_name. Accounts without a password get a generated one time
+secret, written to the credentials file so it can be sent out.
+
+    python -m papersplease.orm.bulk_import committee.csv --credentials secrets.csv
+"""
+import argparse
+import contextlib
+import csv
+import os
+import secrets
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Iterable, Iterator, NamedTuple
+
+from sqlalchemy import insert
+from sqlmodel import Session, SQLModel, select
+
+# connect must be imported before security.password, which imports it in turn
+from .connect import engine
+from .model import Account
+from ..security.password import hash_password
+
+
+REQUIRED_FIELDS = ("email", "first_name", "last_name", "title", "affiliation")
+
+
+class ImportReport(NamedTuple):
+    imported: int
+    skipped: int
+    hash_seconds: float
+    insert_seconds: float
+    generated: dict[str, str]
+    """Email to one time secret, for accounts without a password"""
+
+    @property
+    def per_second(self) -> float:
+        return self.imported / ((self.hash_seconds + self.insert_seconds) or 1)
+
+
+def read_csv(path: str) -> list[dict]:
+    """Reads account rows, splitting a single name column into first and last names"""
+    with open(path, newline="") as f:
+        rows = list(csv.DictReader(f))
+
+    for row in rows:
+        if "first_name" not in row and "name" in row:
+            # Short rows have None for missing columns
+            first, _, last = (row.pop("name") or "").strip().rpartition(" ")
+            row["first_name"], row["last_name"] = (first, last) if first else (last, "")
+
+    return rows
+
+
+def clean_rows(rows: Iterable[dict]) -> list[dict]:
+    """
+    Strips required fields and drops rows without an email, such as blank lines.
+    Raises ValueError for rows missing any other required field, so bad files fail before any hashing.
+    """
+    cleaned = []
+    for number, row in enumerate(rows, 1):
+        if not (row.get("email") or "").strip():
+            continue
+
+        if missing := [field for field in REQUIRED_FIELDS if row.get(field) is None]:
+            raise ValueError(f"Row {number} ({row['email'].strip()}) is missing {', '.join(missing)}")
+
+        cleaned.append({**row, **{field: row[field].strip() for field in REQUIRED_FIELDS}})
+
+    return cleaned
+
+
+def existing_emails(sess: Session, emails: list[str], chunk: int = 5000) -> set[str]:
+    """Which emails already have accounts, looked up a chunk at a time"""
+    found = set()
+    for i in range(0, len(emails), chunk):
+        found.update(sess.exec(select(Account.email).where(Account.email.in_(emails[i:i + chunk]))).all())
+
+    return found
+
+
+def import_accounts(
+    rows: Iterable[dict],
+    workers: int | None = None,
+    batch_size: int = 1000,
+    save_secrets: Callable[[dict[str, str]], None] | None = None,
+) -> ImportReport:
+    """
+    Creates accounts for every row whose email is not taken, hashing passwords across all cores.
+    Each batch's generated secrets are passed to save_secrets before the batch commits, so none are lost if a
+    later batch fails.
+    """
+    # Last row wins for emails repeated in the file
+    by_email = {row["email"]: row for row in clean_rows(rows)}
+
+    with Session(engine) as sess:
+        taken = existing_emails(sess, list(by_email))
+    new = [row for email, row in by_email.items() if email not in taken]
+
+    generated = {}
+    plaintexts = []
+    for row in new:
+        if not (password := row.get("password")):
+            password = generated[row["email"]] = secrets.token_urlsafe(12)
+        plaintexts.append(password)
+
+    workers = workers or os.cpu_count()
+    start = time.perf_counter()
+    with ProcessPoolExecutor(workers) as pool:
+        # Large chunks keep pickling overhead negligible next to bcrypt
+        hashes = list(pool.map(hash_password, plaintexts, chunksize=max(1, len(plaintexts) // (workers * 4))))
+    hash_seconds = time.perf_counter() - start
+
+    records = [
+        dict(**{field: row[field] for field in REQUIRED_FIELDS}, password=hashed)
+        for row, hashed in zip(new, hashes)
+    ]
+
+    start = time.perf_counter()
+    with Session(engine) as sess:
+        for i in range(0, len(records), batch_size):
+            batch = records[i:i + batch_size]
+            sess.execute(insert(Account), batch)
+
+            batch_secrets = {r["email"]: generated[r["email"]] for r in batch if r["email"] in generated}
+            if save_secrets and batch_secrets:
+                save_secrets(batch_secrets)
+            sess.commit()
+    insert_seconds = time.perf_counter() - start
+
+    return ImportReport(
+        imported=len(records),
+        skipped=len(by_email) - len(records),
+        hash_seconds=hash_seconds,
+        insert_seconds=insert_seconds,
+        generated=generated,
+    )
+
+
+@contextlib.contextmanager
+def credentials_file(path: str) -> Iterator[Callable[[dict[str, str]], None]]:
+    """
+    Creates a private file for generated one time secrets, yielding a function that durably appends to it.
+    Never overwrites, as an earlier file may hold the only copy of secrets from a failed run.
+    """
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    with open(fd, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["email", "password"])
+
+        def save(generated: dict[str, str]):
+            writer.writerows(generated.items())
+            f.flush()
+            os.fsync(f.fileno())
+
+        yield save
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("csv", help="accounts to import")
+    parser.add_argument("--credentials", default="credentials.csv", help="where to write generated secrets")
+    parser.add_argument("--workers", type=int, help="hashing processes, defaults to all cores")
+    parser.add_argument("--batch-size", type=int, default=1000, help="accounts inserted per transaction")
+    args = parser.parse_args()
+
+    engine.echo = False
+    # Validated before the credentials file is created, so a bad file leaves nothing behind
+    try:
+        rows = clean_rows(read_csv(args.csv))
+    except ValueError as e:
+        parser.error(str(e))
+
+    # Likewise a database the app has not run against yet, which would fail once the file exists
+    SQLModel.metadata.create_all(engine, tables=[Account.__table__])
+
+    try:
+        with credentials_file(args.credentials) as save_secrets:
+            report = import_accounts(rows, args.workers, args.batch_size, save_secrets)
+    except FileExistsError:
+        parser.error(f"{args.credentials} already exists, move it somewhere safe or pick another --credentials")
+
+    print(f"wrote {len(report.generated)} generated secrets to {args.credentials}")
+
+    print(
+        f"imported {report.imported}, skipped {report.skipped} existing: "
+        f"hashing {report.hash_seconds:.1f}s, inserting {report.insert_seconds:.1f}s, "
+        f"{report.per_second:.0f} accounts/s"
+    )
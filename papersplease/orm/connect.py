@@ -1,18 +1,248 @@
+import contextvars
 import datetime
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, TypeVar
 
+from sqlalchemy import event, inspect, insert
+from sqlalchemy.engine import Engine
 from sqlmodel import create_engine, SQLModel, Session, select
 from ..security.password import password_context
-from .model import Account, Conference, Assignment, Paper, PaperAuthor
+from .model import (Account, Conference, Assignment, Paper, PaperAuthor, Decision, PaperDirectory,
+                    ArchivedConference, ConferenceMember, MemberRole)
 
 sqlite_file_name = "db.sqlite"
 sqlite_url = f"sqlite:///{sqlite_file_name}"
 
+JOURNAL_MODE = "wal"
+"""Journal mode of every database the app writes. WAL lets readers, including online backups, run beside writers."""
+
+
+def use_journal_mode(engine: Engine):
+    """Sets JOURNAL_MODE on every connection of engine. Databases switch on first connect, and stay switched."""
+
+    @event.listens_for(engine, "connect")
+    def journal_mode(dbapi_conn, conn_record):
+        dbapi_conn.execute(f"PRAGMA journal_mode={JOURNAL_MODE}")
+
+
 engine = create_engine(sqlite_url, echo=True, connect_args={"check_same_thread": False})
+use_journal_mode(engine)
+
+# SQLAlchemy resolves relative paths when the engine is created, so must we
+_global_db_path = os.path.abspath(sqlite_file_name)
+
+SHARDED = os.environ.get("PAPERSPLEASE_SHARDED") == "1"
+"""
+If set, conference scoped tables live in a database per conference.
+
+Only writes that stay within a conference, such as recommendations and decisions, leave the global write lock alone.
+Submitting a paper still commits twice to the global database, to reserve its id and index its authors, and assigning
+a reviewer once, to index the reviewer. Those routes contend across conferences as before, if for shorter commits.
+"""
+
+shard_dir = "shards"
+
+archive_file_name = "archive.sqlite"
+"""Read only home of conferences that have finished, see archive.py"""
+
+global_tables = [Account.__table__, Conference.__table__, PaperDirectory.__table__, ArchivedConference.__table__,
+                 ConferenceMember.__table__]
+"""Tables kept in the global database in sharded mode"""
+
+shard_tables = [Paper.__table__, PaperAuthor.__table__, Assignment.__table__, Decision.__table__]
+"""Tables kept in each conference database in sharded mode"""
+
+_shard_engines: dict[int, Engine] = {}
+_shard_lock = threading.Lock()
+
+_archive_engine: Engine | None = None
+
+T = TypeVar("T")
+
+_fan_out_pool = ThreadPoolExecutor(thread_name_prefix="shard-fan-out")
+
+
+def attach_global_db(engine: Engine):
+    """
+    Attaches the global database to every connection of engine, so accounts and conferences can be joined against.
+    SQLite resolves unqualified table names in the main database first, then attached ones.
+    """
+
+    @event.listens_for(engine, "connect")
+    def attach(dbapi_conn, conn_record):
+        dbapi_conn.execute("ATTACH DATABASE ? AS global", (_global_db_path,))
+
+
+def shard_engine(conf_id: int, create: bool = False) -> Engine | None:
+    """
+    Gets the engine for a conferences database. None if it does not exist yet and create is not set.
+    Only paths adding papers should create, so requests can never make files for conferences that do not exist.
+    """
+    if shard := _shard_engines.get(conf_id):
+        return shard
+
+    with _shard_lock:
+        if conf_id not in _shard_engines:
+            path = f"{shard_dir}/conference_{conf_id}.sqlite"
+            if not create and not os.path.exists(path):
+                return None
+
+            os.makedirs(shard_dir, exist_ok=True)
+            url = f"sqlite:///{path}"
+
+            # Create tables before attaching, so tables in the global db are not mistaken for ours
+            bootstrap = create_engine(url)
+            SQLModel.metadata.create_all(bootstrap, tables=shard_tables)
+            bootstrap.dispose()
+
+            shard = create_engine(url, echo=engine.echo, connect_args={"check_same_thread": False})
+            use_journal_mode(shard)
+            attach_global_db(shard)
+            _shard_engines[conf_id] = shard
+
+        return _shard_engines[conf_id]
+
+
+def archive_engine() -> Engine | None:
+    """Gets a read only engine over the archive. None if nothing has been archived yet."""
+    global _archive_engine
+
+    if _archive_engine is None and os.path.exists(archive_file_name):
+        archive = create_engine(
+            f"sqlite:///file:{archive_file_name}?mode=ro&uri=true",
+            echo=engine.echo,
+            connect_args={"check_same_thread": False},
+        )
+        attach_global_db(archive)
+        _archive_engine = archive
+
+    return _archive_engine
+
+
+def read_archive(query: Callable[[Session], T]) -> T | None:
+    """Runs a query against the archive. None if there is no archive."""
+    if archive := archive_engine():
+        with Session(archive) as sess:
+            return query(sess)
+
+    return None
+
+
+def conference_engine(conf_id: int, create: bool = False) -> Engine | None:
+    """Gets the engine holding a conferences papers. None in sharded mode if it has no database yet, see shard_engine."""
+    return shard_engine(conf_id, create) if SHARDED else engine
+
+
+def paper_engine(paper_id: int) -> Engine | None:
+    """Gets the engine holding a paper. None if the paper does not exist in sharded mode."""
+    if not SHARDED:
+        return engine
+
+    with Session(engine) as sess:
+        entry = sess.get(PaperDirectory, paper_id)
+
+    return entry and shard_engine(entry.conference_id)
+
+
+def conference_engines(history: bool = False) -> list[Engine]:
+    """Every engine holding papers. History includes the archive of finished conferences."""
+    engines = [engine]
+    if SHARDED:
+        with Session(engine) as sess:
+            conf_ids = sess.exec(
+                select(Conference.id).where(
+                    Conference.id.not_in(select(ArchivedConference.conference_id))
+                )
+            ).all()
+
+        engines = [shard for conf_id in conf_ids if (shard := shard_engine(conf_id))]
+
+    if history and (archive := archive_engine()):
+        engines.append(archive)
+
+    return engines
+
+
+def fan_out(query: Callable[[Session], list[T]], history: bool = False) -> list[T]:
+    """Runs a query against every engine holding papers, concatenating the results. Shards are queried in parallel."""
+
+    def run(eng: Engine) -> list[T]:
+        with Session(eng) as sess:
+            return list(query(sess))
+
+    engines = conference_engines(history)
+    if not SHARDED:
+        return [row for eng in engines for row in run(eng)]
+
+    # Copy context so per-request state, like query logging, follows into the pool
+    futures = [
+        _fan_out_pool.submit(contextvars.copy_context().run, run, eng)
+        for eng in engines
+    ]
+    return [row for fut in futures for row in fut.result()]
+
+
+def allocate_paper_id(conf_id: int) -> int | None:
+    """Reserves a globally unique paper id in sharded mode. None when ids are left to the database."""
+    if not SHARDED:
+        return None
+
+    # The directory must never point at a database that does not exist
+    shard_engine(conf_id, create=True)
+
+    with Session(engine) as sess:
+        entry = PaperDirectory(conference_id=conf_id)
+        sess.add(entry)
+        sess.commit()
+        return entry.id
+
+
+def _insert_members(rows: list[dict]):
+    with Session(engine) as sess:
+        sess.execute(insert(ConferenceMember).prefix_with("OR IGNORE"), rows)
+        sess.commit()
+
+
+def record_members(conf_id: int, emails: list[str], role: MemberRole):
+    """
+    Indexes the authors or reviewers of a conference globally, so roles are known without reading paper tables.
+    This is a commit to the global database, in sharded mode too.
+    """
+    if emails:
+        _insert_members([dict(conference_id=conf_id, email=email, role=role) for email in emails])
+
+
+def _index_members():
+    """Indexes the members of every conference, including archived ones, for databases older than the index"""
+    for eng in conference_engines(history=True):
+        with Session(eng) as sess:
+            authors = sess.exec(
+                select(Paper.conference_id, PaperAuthor.author_email)
+                .join(PaperAuthor, PaperAuthor.paper_id == Paper.id)
+                .distinct()
+            ).all()
+            reviewers = sess.exec(
+                select(Paper.conference_id, Assignment.reviewer_email)
+                .join(Assignment, Assignment.paper_id == Paper.id)
+                .distinct()
+            ).all()
+
+        rows = [dict(conference_id=conf_id, email=email, role=MemberRole.author) for conf_id, email in authors]
+        rows += [dict(conference_id=conf_id, email=email, role=MemberRole.reviewer) for conf_id, email in reviewers]
+        if rows:
+            _insert_members(rows)
 
 
 def prepare_db():
+    index_members = not inspect(engine).has_table(ConferenceMember.__tablename__)
+
     # Create tables if not exists
-    SQLModel.metadata.create_all(engine)
+    SQLModel.metadata.create_all(engine, tables=global_tables if SHARDED else global_tables + shard_tables)
+
+    if index_members:
+        _index_members()
 
     with Session(engine) as sess:
         # Add demo users if not exists
@@ -38,15 +268,19 @@ def prepare_db():
             sess.add(c1)
             sess.commit()
 
-            p1 = Paper(conference_id=c1.id, title="Sensingbay")
+            with Session(conference_engine(c1.id, create=True)) as conf_sess:
+                p1 = Paper(id=allocate_paper_id(c1.id), conference_id=c1.id, title="Sensingbay")
 
-            sess.add(p1)
-            sess.commit()
+                conf_sess.add(p1)
+                conf_sess.commit()
 
-            pa1 = PaperAuthor(paper_id=p1.id, author_email="laurasas@umich.edu")
+                pa1 = PaperAuthor(paper_id=p1.id, author_email="laurasas@umich.edu")
 
-            r1 = Assignment(reviewer_email="avealov@umich.edu", paper_id=p1.id)
+                r1 = Assignment(reviewer_email="avealov@umich.edu", paper_id=p1.id)
 
-            sess.add(r1)
-            sess.add(pa1)
-            sess.commit()
+                conf_sess.add(r1)
+                conf_sess.add(pa1)
+                conf_sess.commit()
+
+            record_members(c1.id, ["laurasas@umich.edu"], MemberRole.author)
+            record_members(c1.id, ["avealov@umich.edu"], MemberRole.reviewer)
@@ -0,0 +1,120 @@
+import json
+from typing import NamedTuple, Optional
+
+from sqlalchemy import func, exists
+from sqlmodel import Session, select
+
+from .model import (
+    Paper,
+    PaperAuthor,
+    Assignment,
+    Conference,
+    Decision,
+    DecisionStatus,
+    Recommendation,
+)
+
+
+class AssignmentView(NamedTuple):
+    reviewer_email: str
+    recommendation: Recommendation
+
+
+class AuthorPaperView(NamedTuple):
+    paper_id: int
+    title: str
+    conference_name: str
+    decision: Optional[DecisionStatus]
+    authors: str
+
+
+class ChairPaperView(NamedTuple):
+    paper_id: int
+    title: str
+    conference_id: int
+    conference_name: str
+    conference_chair: str
+    decision: Optional[DecisionStatus]
+    authors: str
+    assignments: list[AssignmentView]
+
+
+def _authors_of_paper():
+    """Correlated subquery of a papers comma separated author emails"""
+    return (
+        select(func.group_concat(PaperAuthor.author_email, ","))
+        .where(PaperAuthor.paper_id == Paper.id)
+        .scalar_subquery()
+    )
+
+
+def _assignments_of_paper():
+    """Correlated subquery of a papers assignments, as a JSON array of [email, recommendation] pairs"""
+    return (
+        select(
+            func.json_group_array(
+                func.json_array(Assignment.reviewer_email, Assignment.recommendation)
+            )
+        )
+        .where(Assignment.paper_id == Paper.id)
+        .scalar_subquery()
+    )
+
+
+def load_author_paper(
+    sess: Session, email: str, paper_id: int
+) -> AuthorPaperView | None:
+    """Loads the author paper view in one statement. None if the paper does not exist or is not the users."""
+    row = sess.exec(
+        select(
+            Paper.id,
+            Paper.title,
+            Conference.name,
+            Decision.status,
+            _authors_of_paper(),
+        )
+        .join(Conference, Conference.id == Paper.conference_id)
+        .outerjoin(Decision, Decision.paper_id == Paper.id)
+        .where(Paper.id == paper_id)
+        .where(
+            exists().where(
+                PaperAuthor.paper_id == Paper.id, PaperAuthor.author_email == email
+            )
+        )
+    ).first()
+
+    return row and AuthorPaperView(*row)
+
+
+def load_chair_paper(sess: Session, paper_id: int) -> ChairPaperView | None:
+    """Loads the chair paper view in one statement. None if the paper does not exist."""
+    row = sess.exec(
+        select(
+            Paper.id,
+            Paper.title,
+            Conference.id,
+            Conference.name,
+            Conference.chair,
+            Decision.status,
+            _authors_of_paper(),
+            _assignments_of_paper(),
+        )
+        .join(Conference, Conference.id == Paper.conference_id)
+        .outerjoin(Decision, Decision.paper_id == Paper.id)
+        .where(Paper.id == paper_id)
+    ).first()
+
+    if not row:
+        return None
+
+    *fields, authors, assignments = row
+
+    # Recommendations are stored by enum name
+    return ChairPaperView(
+        *fields,
+        authors or "",
+        [
+            AssignmentView(email, Recommendation[rec])
+            for email, rec in json.loads(assignments)
+        ],
+    )
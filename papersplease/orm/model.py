@@ -35,6 +35,17 @@ class Paper(SQLModel, table=True):
     conference_id: int = Field(foreign_key="conference.id")
     title: str
 
+    # Ids of archived papers must never be handed out again
+    __table_args__ = {"sqlite_autoincrement": True}
+
+
+class PaperDirectory(SQLModel, table=True):
+    """Global index of which conference shard holds a paper. Only used in sharded mode."""
+    id: Optional[int] = Field(primary_key=True, default=None)
+    conference_id: int = Field(foreign_key="conference.id")
+
+    __table_args__ = {"sqlite_autoincrement": True}
+
 
 class PaperAuthor(SQLModel, table=True):
     paper_id: int = Field(foreign_key="paper.id")
@@ -70,3 +81,30 @@ class DecisionStatus(pydantic.main.Enum):
 class Decision(SQLModel, table=True):
     paper_id: int = Field(foreign_key="paper.id", primary_key=True)
     status: DecisionStatus
+
+
+class MemberRole(pydantic.main.Enum):
+    author = "author"
+    reviewer = "reviewer"
+
+
+class ConferenceMember(SQLModel, table=True):
+    """
+    Global index of who authors or reviews papers in each conference.
+    Kept when a conference is archived, and readable without opening shards.
+    """
+    conference_id: int = Field(foreign_key="conference.id")
+    email: str = Field(foreign_key="account.email")
+    role: MemberRole
+
+    __table_args__ = (
+        PrimaryKeyConstraint("conference_id", "email", "role"),
+    )
+
+
+class ArchivedConference(SQLModel, table=True):
+    """Record of a conference moved to the archive database, and its snapshot"""
+    conference_id: int = Field(primary_key=True)
+    archived_at: datetime.datetime
+    snapshot: str
+    sha256: str
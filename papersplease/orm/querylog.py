@@ -0,0 +1,115 @@
+import contextvars
+import logging
+import os
+import time
+from typing import NamedTuple, Callable
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+
+class Query(NamedTuple):
+    statement: str
+    seconds: float
+
+
+class QueryLog:
+    """Every statement issued while the log is active"""
+
+    def __init__(self):
+        self.queries: list[Query] = []
+
+    def __len__(self):
+        return len(self.queries)
+
+    @property
+    def seconds(self) -> float:
+        return sum(q.seconds for q in self.queries)
+
+
+# Logs can nest, each gets every statement issued while it is active
+_active_logs: contextvars.ContextVar[tuple[QueryLog, ...]] = contextvars.ContextVar(
+    "query_logs", default=()
+)
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    query = Query(statement, time.perf_counter() - conn.info["query_start"].pop())
+    for log in _active_logs.get():
+        log.queries.append(query)
+
+
+class record_queries:
+    """Context manager recording statements issued on any engine into a QueryLog"""
+
+    def __enter__(self) -> QueryLog:
+        self.log = QueryLog()
+        self.token = _active_logs.set((*_active_logs.get(), self.log))
+        return self.log
+
+    def __exit__(self, *exc):
+        _active_logs.reset(self.token)
+
+
+def query_budget(statements: int):
+    """Declares the most SQL statements a route may issue, including its dependencies."""
+
+    def decorator(func: Callable) -> Callable:
+        func.query_budget = statements
+        return func
+
+    return decorator
+
+
+class QueryBudgetExceeded(Exception):
+    def __init__(self, route: str, budget: int, log: QueryLog):
+        listing = "\n".join(
+            f"  [{i}] ({q.seconds * 1000:.2f}ms) {q.statement}"
+            for i, q in enumerate(log.queries, 1)
+        )
+        super().__init__(
+            f"{route} issued {len(log)} statements, budget is {budget}:\n{listing}"
+        )
+
+
+class QueryBudgetMiddleware:
+    """
+    Checks each request against the budget declared on its route.
+    In strict mode, going over budget raises QueryBudgetExceeded, otherwise it is logged.
+    """
+
+    def __init__(self, app, strict: bool = False):
+        self.app = app
+        self.strict = strict
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        with record_queries() as log:
+            await self.app(scope, receive, send)
+
+        # Routing fills in the endpoint on the shared scope
+        budget = getattr(scope.get("endpoint"), "query_budget", None)
+        route = f"{scope['method']} {scope['path']}"
+        logger.debug(
+            "%s issued %d statements in %.2fms", route, len(log), log.seconds * 1000
+        )
+        if budget is not None and len(log) > budget:
+            err = QueryBudgetExceeded(route, budget, log)
+            if self.strict:
+                raise err
+            logger.warning(str(err))
+
+
+def budget_mode() -> str | None:
+    """Budget enforcement from PAPERSPLEASE_QUERY_BUDGETS, either 'warn' or 'strict'"""
+    return os.environ.get("PAPERSPLEASE_QUERY_BUDGETS")
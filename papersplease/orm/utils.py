@@ -1,45 +1,10 @@
 from typing import NamedTuple
 
+from sqlalchemy import exists
 from sqlmodel import Session, select
 
 from .connect import engine
-from .model import Account, Conference, PaperAuthor, Assignment
-
-
-def user_is_chair_of_any(email: str) -> bool:
-    """Checks if user is a chair of any conference"""
-    with Session(engine) as sess:
-        res = sess.exec(
-            select(Account)
-            .where(Account.email == email)
-            .join(Conference, Conference.chair == Account.email)
-        )
-
-        return bool(res.first())
-
-
-def user_is_author(email: str) -> bool:
-    """Checks if user is an author"""
-    with Session(engine) as sess:
-        res = sess.exec(
-            select(Account)
-            .where(Account.email == email)
-            .join(PaperAuthor, PaperAuthor.author_email == Account.email)
-        )
-
-        return bool(res.first())
-
-
-def user_is_reviewer(email: str) -> bool:
-    """Checks if user is a reviewer"""
-    with Session(engine) as sess:
-        res = sess.exec(
-            select(Account)
-            .where(Account.email == email)
-            .join(Assignment, Assignment.reviewer_email == Account.email)
-        )
-
-        return bool(res.first())
+from .model import Conference, ConferenceMember, MemberRole
 
 
 class Roles(NamedTuple):
@@ -50,8 +15,14 @@ class Roles(NamedTuple):
 
 def user_roles(email: str) -> Roles:
     """Gets all roles a user is a part of, globally. For use in UI, not per conference."""
-    return Roles(
-        author=user_is_author(email),
-        chair=user_is_chair_of_any(email),
-        reviewer=user_is_reviewer(email),
-    )
+    # Membership is indexed globally, so archived and sharded conferences need no extra queries
+    with Session(engine) as sess:
+        found = sess.exec(
+            select(
+                exists().where(ConferenceMember.email == email, ConferenceMember.role == MemberRole.author),
+                exists().where(Conference.chair == email),
+                exists().where(ConferenceMember.email == email, ConferenceMember.role == MemberRole.reviewer),
+            )
+        ).one()
+
+    return Roles(*(bool(role) for role in found))
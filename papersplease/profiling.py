@@ -0,0 +1,188 @@
+import cProfile
+import datetime
+import logging
+import os
+import random
+import re
+from datetime import timedelta
+from urllib.parse import parse_qs
+
+from jose import jwt, JWTError
+
+from .orm.querylog import record_queries, QueryLog
+from .security.token import SECRET_KEY, ALGORITHM
+
+try:
+    import pyinstrument
+except ImportError:
+    pyinstrument = None
+
+logger = logging.getLogger(__name__)
+
+PROFILE_HEADER = b"x-profile"
+PROFILE_PARAM = "profile"
+PROFILE_AUDIENCE = "profile"
+STREAM_CONTENT_TYPE = b"text/event-stream"
+
+
+def create_profile_token(minutes: int = 60) -> str:
+    """Signs a token that lets its holder profile requests. Hand out to admins only."""
+    return jwt.encode(
+        {
+            "exp": datetime.datetime.utcnow() + timedelta(minutes=minutes),
+            "sub": "profile",
+            # Sets profile tokens apart from login tokens, which decode rejects
+            "aud": PROFILE_AUDIENCE,
+        },
+        SECRET_KEY,
+        algorithm=ALGORITHM,
+    )
+
+
+def valid_profile_token(token: str) -> bool:
+    try:
+        claims = jwt.decode(token, SECRET_KEY, ALGORITHM, audience=PROFILE_AUDIENCE)
+    except JWTError:
+        return False
+
+    # jose accepts tokens without any audience, like login tokens, so check it was set
+    return claims.get("aud") == PROFILE_AUDIENCE and claims.get("sub") == "profile"
+
+
+def is_stream(start_message) -> bool:
+    """If a response is a long lived stream, like server sent events"""
+    return any(
+        name == b"content-type" and value.startswith(STREAM_CONTENT_TYPE)
+        for name, value in start_message.get("headers", [])
+    )
+
+
+def profile_settings() -> dict:
+    """Profiler options from the environment"""
+    return {
+        "out_dir": os.environ.get("PAPERSPLEASE_PROFILE_DIR", "profiles"),
+        "sample_rate": float(os.environ.get("PAPERSPLEASE_PROFILE_SAMPLE", 0)),
+        "keep": int(os.environ.get("PAPERSPLEASE_PROFILE_KEEP", 100)),
+    }
+
+
+class ProfilingMiddleware:
+    """
+    Profiles requests carrying a signed profile token in the X-Profile header or ?profile= parameter,
+    plus a random sample of all requests. The handler, its dependencies and template rendering are profiled,
+    and the SQL issued is recorded.
+
+    Reports go to out_dir, as pyinstrument HTML if it is installed or cProfile pstats otherwise.
+    Only the newest `keep` reports are kept.
+
+    pyinstrument is optional and not in requirements.txt. Without it, cProfile profiles the whole thread, so a report
+    also counts every other coroutine the event loop ran while the request awaited. Install pyinstrument for
+    reports of the profiled request alone.
+    """
+
+    def __init__(
+        self, app, out_dir: str = "profiles", sample_rate: float = 0, keep: int = 100
+    ):
+        self.app = app
+        self.out_dir = out_dir
+        self.sample_rate = sample_rate
+        self.keep = keep
+        # Only one profiler can be active in the process at a time
+        self.busy = False
+
+    def requested(self, scope) -> bool:
+        for name, value in scope["headers"]:
+            if name == PROFILE_HEADER:
+                return valid_profile_token(value.decode())
+
+        if tokens := parse_qs(scope["query_string"].decode()).get(PROFILE_PARAM):
+            return valid_profile_token(tokens[0])
+
+        return False
+
+    async def __call__(self, scope, receive, send):
+        if (
+            scope["type"] != "http"
+            or self.busy
+            or not (self.requested(scope) or random.random() < self.sample_rate)
+        ):
+            return await self.app(scope, receive, send)
+
+        if pyinstrument:
+            profiler = pyinstrument.Profiler(async_mode="enabled")
+            start, stop = profiler.start, profiler.stop
+        else:
+            profiler = cProfile.Profile()
+            start, stop = profiler.enable, profiler.disable
+
+        streaming = False
+
+        async def send_checking_stream(message):
+            nonlocal streaming
+            # Streams can stay open indefinitely, holding the profiler, so give it up once one starts
+            if (
+                not streaming
+                and message["type"] == "http.response.start"
+                and is_stream(message)
+            ):
+                streaming = True
+                stop()
+                self.busy = False
+            await send(message)
+
+        self.busy = True
+        try:
+            with record_queries() as log:
+                start()
+                try:
+                    await self.app(scope, receive, send_checking_stream)
+                finally:
+                    if not streaming:
+                        stop()
+        finally:
+            # A stream gave the profiler up when it started, and another request may hold it by now
+            if not streaming:
+                self.busy = False
+
+        if streaming:
+            logger.info("Not profiling stream %s %s", scope["method"], scope["path"])
+            return
+
+        try:
+            self.write_report(scope, profiler, log)
+        except OSError:
+            logger.exception("Failed to write profile")
+
+    def write_report(self, scope, profiler, log: QueryLog):
+        os.makedirs(self.out_dir, exist_ok=True)
+
+        path = re.sub(r"[^A-Za-z0-9]+", "_", scope["path"]).strip("_") or "root"
+        base = os.path.join(
+            self.out_dir,
+            f"{datetime.datetime.utcnow():%Y%m%dT%H%M%S%f}-{scope['method']}-{path}",
+        )
+
+        if pyinstrument:
+            with open(f"{base}.html", "w") as f:
+                f.write(profiler.output_html())
+        else:
+            profiler.dump_stats(f"{base}.pstats")
+
+        with open(f"{base}.sql", "w") as f:
+            f.write(f"-- {len(log)} statements in {log.seconds * 1000:.2f}ms\n")
+            for query in log.queries:
+                f.write(f"-- {query.seconds * 1000:.2f}ms\n{query.statement};\n\n")
+
+        logger.info("Profiled %s %s to %s", scope["method"], scope["path"], base)
+        self.rotate()
+
+    def rotate(self):
+        """Deletes all but the newest reports"""
+        reports = sorted(
+            (entry for entry in os.scandir(self.out_dir) if entry.is_file()),
+            key=lambda entry: entry.name,
+            reverse=True,
+        )
+        # Each report is a profile plus its SQL
+        for entry in reports[self.keep * 2 :]:
+            os.remove(entry.path)
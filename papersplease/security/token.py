@@ -43,6 +43,10 @@ def decode(encoded: str) -> TokenData | None:
     except JWTError:
         return None
 
+    # Login tokens have no audience, other tokens signed with our key, like profile tokens, do
+    if "aud" in payload:
+        return None
+
     email = payload.get("sub")
 
     return email and TokenData(email=email)
@@ -0,0 +1,102 @@
+"""
+Runs the app against a fresh, seeded database in a temporary working directory.
+
+The app finds its databases, templates and static files relative to the working directory, and reads its settings
+from the environment on import, so main is only imported once both are in place.
+"""
+import datetime
+import os
+
+import pytest
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PASSWORD = "secret"
+CHAIR = "chair@example.com"
+AUTHOR = "author@example.com"
+REVIEWER = "reviewer@example.com"
+SPARE_REVIEWER = "spare@example.com"
+
+
+@pytest.fixture(scope="session")
+def app(tmp_path_factory):
+    workdir = tmp_path_factory.mktemp("papersplease")
+    os.symlink(os.path.join(REPO, "papersplease"), workdir / "papersplease")
+
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    os.environ["PAPERSPLEASE_QUERY_BUDGETS"] = "strict"
+    # Budgets are not checked when sharded
+    os.environ.pop("PAPERSPLEASE_SHARDED", None)
+
+    import main
+    from papersplease.orm import connect
+
+    connect.engine.echo = False
+    connect.prepare_db()
+
+    yield main.app
+
+    os.chdir(cwd)
+
+
+@pytest.fixture(scope="session")
+def seed(app) -> dict:
+    """An open conference with a paper under review, and one awaiting a decision"""
+    from sqlmodel import Session
+
+    from papersplease.orm.connect import engine, record_members
+    from papersplease.orm.model import Account, Conference, Paper, PaperAuthor, Assignment, MemberRole
+    from papersplease.security.password import hash_password
+
+    hashed = hash_password(PASSWORD)
+    soon = datetime.date.today() + datetime.timedelta(days=30)
+
+    with Session(engine) as sess:
+        for email in (CHAIR, AUTHOR, REVIEWER, SPARE_REVIEWER):
+            sess.add(Account(email=email, first_name="A", last_name="B", title="Dr.", affiliation="x", password=hashed))
+
+        conf = Conference(name="Open", city="c", state="s", country="c", start_date=soon, end_date=soon,
+                          paper_deadline=soon, chair=CHAIR)
+        sess.add(conf)
+        sess.commit()
+
+        reviewed = Paper(conference_id=conf.id, title="Under review")
+        decided = Paper(conference_id=conf.id, title="Awaiting decision")
+        sess.add_all([reviewed, decided])
+        sess.commit()
+
+        for paper in (reviewed, decided):
+            sess.add(PaperAuthor(paper_id=paper.id, author_email=AUTHOR))
+            sess.add(Assignment(paper_id=paper.id, reviewer_email=REVIEWER))
+        sess.commit()
+
+        ids = dict(conf_id=conf.id, paper_id=reviewed.id, decided_paper_id=decided.id)
+
+    record_members(ids["conf_id"], [AUTHOR], MemberRole.author)
+    record_members(ids["conf_id"], [REVIEWER], MemberRole.reviewer)
+
+    return ids
+
+
+@pytest.fixture(scope="session")
+def client(app):
+    from fastapi.testclient import TestClient
+
+    with TestClient(app) as client:
+        # Redirects are asserted on, not followed
+        client.follow_redirects = False
+        yield client
+
+
+@pytest.fixture
+def login(client):
+    """Logs the client in as an account, or out with None"""
+    from papersplease.security.token import create_access_token
+
+    def login(email: str | None):
+        client.cookies.clear()
+        if email:
+            client.cookies.set("access_token", f"bearer {create_access_token(email)}")
+
+    return login
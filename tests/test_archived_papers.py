@@ -0,0 +1,71 @@
+"""
+Papers of archived conferences can still be viewed by their chair, but no longer changed.
+"""
+import datetime
+
+import pytest
+
+from .conftest import AUTHOR, CHAIR, REVIEWER, SPARE_REVIEWER
+
+
+@pytest.fixture(scope="session")
+def archived_paper_id(seed) -> int:
+    """A paper of a finished conference, moved to the archive"""
+    from sqlmodel import Session
+
+    from papersplease.orm.archive import archive_conference
+    from papersplease.orm.connect import engine
+    from papersplease.orm.model import Conference, Paper, PaperAuthor, Assignment
+
+    past = datetime.date.today() - datetime.timedelta(days=30)
+
+    with Session(engine) as sess:
+        conf = Conference(name="Finished", city="c", state="s", country="c", start_date=past, end_date=past,
+                          paper_deadline=past, chair=CHAIR)
+        sess.add(conf)
+        sess.commit()
+
+        paper = Paper(conference_id=conf.id, title="Archived")
+        sess.add(paper)
+        sess.commit()
+
+        sess.add(PaperAuthor(paper_id=paper.id, author_email=AUTHOR))
+        sess.add(Assignment(paper_id=paper.id, reviewer_email=REVIEWER))
+        sess.commit()
+
+        conf_id, paper_id = conf.id, paper.id
+
+    archive_conference(conf_id)
+    return paper_id
+
+
+def test_chair_views_archived_paper_without_write_controls(client, login, archived_paper_id):
+    login(CHAIR)
+    response = client.get(f"/conferences/paper?paper_id={archived_paper_id}")
+
+    assert response.status_code == 200, response.text
+    assert "Archived" in response.text
+    assert 'id="decision"' not in response.text
+    assert "reviewer-needed" not in response.text
+
+
+@pytest.mark.parametrize(
+    "url, body",
+    [
+        ("/decision", {"decision": "publish"}),
+        ("/assignments", {"email": SPARE_REVIEWER}),
+    ],
+)
+def test_archived_paper_cannot_be_changed(client, login, archived_paper_id, url, body):
+    login(CHAIR)
+    response = client.post(url, json={**body, "paper_id": archived_paper_id})
+
+    assert response.status_code == 409, response.text
+
+
+@pytest.mark.parametrize("url", ["/decision", "/assignments"])
+def test_unknown_paper_is_not_found(client, login, seed, url):
+    login(CHAIR)
+    response = client.post(url, json={"decision": "publish", "email": SPARE_REVIEWER, "paper_id": 10 ** 6})
+
+    assert response.status_code == 404, response.text
@@ -0,0 +1,96 @@
+"""
+Every route stays within its declared query budget.
+
+The app runs in strict budget mode, so a route issuing too many statements raises QueryBudgetExceeded, listing them.
+"""
+import pytest
+from fastapi.routing import APIRoute
+
+from .conftest import AUTHOR, CHAIR, PASSWORD, REVIEWER, SPARE_REVIEWER
+
+# Endpoint name, account, method, url, request arguments, expected status.
+# Strings are formatted with the seeded ids. An endpoint may appear more than once, to cover differently sized requests.
+ROUTES = [
+    ("root", AUTHOR, "GET", "/", {}, 200),
+    ("author_page", AUTHOR, "GET", "/author", {}, 200),
+    ("author_paperview", AUTHOR, "GET", "/author/paper?paper_id={paper_id}", {}, 200),
+    ("author_sub_1", AUTHOR, "GET", "/author/papersub1", {}, 200),
+    ("author_sub_2", AUTHOR, "GET", "/author/papersub2?conf_id={conf_id}", {}, 200),
+    (
+        "paper_create", AUTHOR, "POST", "/author/paper",
+        {"data": {"paper_title": "New", "authors": f"{AUTHOR},", "conf_id": "{conf_id}"}}, 201,
+    ),
+    (
+        "paper_create", AUTHOR, "POST", "/author/paper",
+        {
+            "data": {
+                "paper_title": "Coauthored",
+                "authors": f"{AUTHOR},{REVIEWER},{SPARE_REVIEWER},",
+                "conf_id": "{conf_id}",
+            }
+        },
+        201,
+    ),
+    (
+        "recommendation_update", REVIEWER, "PUT", "/assignments",
+        {"json": {"recommendation": "accept", "paper_id": "{paper_id}"}}, 200,
+    ),
+    ("assignments_home", REVIEWER, "GET", "/assignments", {}, 200),
+    (
+        "assignments_create", CHAIR, "POST", "/assignments",
+        {"json": {"email": SPARE_REVIEWER, "paper_id": "{paper_id}"}}, 201,
+    ),
+    ("chair_home", CHAIR, "GET", "/conferences", {}, 200),
+    ("chair_paperlist", CHAIR, "GET", "/conferences/papers?conf_id={conf_id}", {}, 200),
+    ("chair_paperview", CHAIR, "GET", "/conferences/paper?paper_id={paper_id}", {}, 200),
+    ("chair_events", CHAIR, "GET", "/conferences/events?conf_id={conf_id}", {}, 200),
+    (
+        "decision_update", CHAIR, "POST", "/decision",
+        {"json": {"decision": "publish", "paper_id": "{decided_paper_id}"}}, 200,
+    ),
+    ("login", None, "GET", "/login", {}, 200),
+    ("create_token", None, "POST", "/token", {"data": {"username": AUTHOR, "password": PASSWORD}}, 200),
+    ("logout", AUTHOR, "GET", "/logout", {}, 307),
+    ("api_papers", AUTHOR, "GET", "/api/v1/papers", {}, 200),
+    ("api_assignments", REVIEWER, "GET", "/api/v1/assignments", {}, 200),
+    ("api_conferences", CHAIR, "GET", "/api/v1/conferences?owned=true", {}, 200),
+    ("api_reviews", CHAIR, "GET", "/api/v1/conferences/{conf_id}/reviews", {}, 200),
+]
+
+
+def fill(value, ids: dict):
+    """Formats the seeded ids into every string of a request"""
+    if isinstance(value, str):
+        return value.format(**ids)
+    if isinstance(value, dict):
+        return {key: fill(item, ids) for key, item in value.items()}
+    return value
+
+
+@pytest.fixture
+def finite_events(monkeypatch):
+    """Ends event streams at once, as they otherwise only end when the client disconnects"""
+    import main
+
+    async def one_event(channel, is_disconnected):
+        yield ": test\n\n"
+
+    monkeypatch.setattr(main, "event_stream", one_event)
+
+
+@pytest.mark.parametrize(
+    "email, method, url, kwargs, expected",
+    [route[1:] for route in ROUTES],
+    ids=[route[0] for route in ROUTES],
+)
+def test_route_within_budget(client, login, seed, finite_events, email, method, url, kwargs, expected):
+    login(email)
+    response = client.request(method, fill(url, seed), **fill(kwargs, seed))
+    assert response.status_code == expected, response.text
+
+
+def test_every_route_has_a_budget_and_a_test(app):
+    endpoints = {route.endpoint.__name__: route.endpoint for route in app.routes if isinstance(route, APIRoute)}
+
+    assert [name for name, endpoint in endpoints.items() if not hasattr(endpoint, "query_budget")] == []
+    assert sorted(endpoints) == sorted({route[0] for route in ROUTES})